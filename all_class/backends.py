@@ -0,0 +1,365 @@
+import copy
+import json
+import logging
+import os
+import cv2
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+#Backends of the model
+HUB = "hub"
+#The hub model serialized with TorchScript on the first launch, the next launches load only the artifact
+CACHED = "cached"
+TORCHSCRIPT = "torchscript"
+ONNX = "onnx"
+OPENVINO = "openvino"
+
+
+####################################################################################################
+#Detector's backends : Each backend load the model in its own runtime and return, for a list of BGR frames,
+#                      one array of detections per frame, one row [x1, y1, x2, y2, confidence, class] per box,
+#                      in the coordinates of the frame multiplied by its scale.
+#torch is imported by the backends using it, the other runtimes start without it.
+#Common parameters :
+#   String model_path : The path to the model (.pt, .torchscript, .onnx or .xml).
+#   dict settings : The NMS settings of the Model (conf, iou, classes, max_det, agnostic).
+#   int size : The input size of the model, used when the model accept several sizes.
+#Common methods :
+#   infer(frames, scales) :
+#       Return the detections of each frame.
+#       scales : The factor (x, y) of the coordinates of each frame, to give the boxes at another resolution
+#                (the screen) without resizing the frames. None for the coordinates of the frames. A crop adds
+#                the (height, width) of its frame, (x, y, (height, width)), to be resized like the whole frame.
+####################################################################################################
+
+
+#The color of the padding of the letterbox (as YOLOv5)
+PAD_COLOR = 114
+#The backends with an input sized for each frame, a crop runs on less pixels than the whole frame. The others
+#run on a fixed shape (the one of the export or of the trace), a crop would only be resized to it.
+CROP_BACKENDS = {HUB}
+
+
+####################################################################################################
+#Preprocessor : Convert BGR frames to the float NCHW RGB input of the model, keeping their ratio (as the YOLOv5
+#               letterbox). Each frame is resized once, directly into a padded buffer allocated once, then
+#               converted into the input batch, also allocated once. The padding is only filled again when the
+#               size of the frames change. This resize is the only one of the frames on the way to the model.
+#Parameters :
+#   int size : The input size of the model.
+#   int stride : 0 for a square input of size x size (exported models), else the smallest input with sides
+#                multiple of stride containing the frame resized to size (eager models, as AutoShape). A crop
+#                is resized by the ratio of its whole frame, its input is smaller than the one of the frame.
+#   tuple shape : A fixed input (height, width), for the models traced on one shape, None to use size and stride.
+#Attributes :
+#   self.batch : The input batch, reused by the next call.
+#   self.padded : The padded frame of each image of the batch.
+#   self.layouts : The layout (frame shape, padding) of each padded frame, the padding is valid for it.
+#Methods :
+#   __call__(frames, scales) :
+#       Return the input batch of the frames (valid until the next call) and the transform of each frame,
+#       ((factor_x, factor_y), (pad_x, pad_y), (max_x, max_y)), to map the boxes back to the frame multiplied by
+#       its scale (see postprocess()).
+#   get_shape(height, width) :
+#       Return the input (height, width) of a frame of this size.
+####################################################################################################
+class Preprocessor :
+    def __init__(self, size, stride = 0, shape = None) :
+        self.size = size
+        self.stride = stride
+        self.shape = tuple(shape) if shape is not None else None
+        self.batch = np.empty((0, 3, 0, 0), dtype=np.float32)
+        self.padded = []
+        self.layouts = []
+
+    def __call__(self, frames, scales = None) :
+        if scales is None :
+            scales = [None] * len(frames)
+        #Ratio and resized size of each frame
+        resized = []
+        for frame, scale in zip(frames, scales) :
+            height, width = frame.shape[:2]
+            if self.shape is not None :
+                ratio = min(self.shape[0] / height, self.shape[1] / width)
+            else :
+                #A crop keeps the resolution of its whole frame
+                frame_height, frame_width = scale[2] if scale is not None and len(scale) > 2 else (height, width)
+                ratio = min(self.size / frame_height, self.size / frame_width)
+            resized.append((ratio, int(round(width * ratio)), int(round(height * ratio))))
+        if self.shape is not None :
+            input_height, input_width = self.shape
+        elif not self.stride :
+            input_height = input_width = self.size
+        else :
+            shapes = [self._align(new_height, new_width) for _, new_width, new_height in resized]
+            input_height = max(height for height, _ in shapes)
+            input_width = max(width for _, width in shapes)
+        if len(frames) > len(self.batch) or self.batch.shape[2:] != (input_height, input_width) :
+            self._allocate(max(len(frames), len(self.batch)), input_height, input_width)
+        transforms = []
+        for i, (frame, scale, (ratio, new_width, new_height)) in enumerate(zip(frames, scales, resized)) :
+            pad_x, pad_y = (input_width - new_width) // 2, (input_height - new_height) // 2
+            padded = self.padded[i]
+            layout = (frame.shape[:2], pad_x, pad_y)
+            if self.layouts[i] != layout :
+                padded.fill(PAD_COLOR)
+                self.layouts[i] = layout
+            cv2.resize(frame, (new_width, new_height), dst=padded[pad_y:pad_y + new_height, pad_x:pad_x + new_width],
+                       interpolation=cv2.INTER_LINEAR)
+            #BGR to RGB, HWC to CHW and 0-255 to 0-1 in one pass
+            np.multiply(padded[:, :, ::-1].transpose(2, 0, 1), 1 / 255, out=self.batch[i], casting="unsafe")
+            #Input to frame (undo the resize) then frame to scale, in one factor
+            scale_x, scale_y = scale[:2] if scale is not None else (1, 1)
+            height, width = frame.shape[:2]
+            transforms.append(((scale_x / ratio, scale_y / ratio), (pad_x, pad_y), (width * scale_x, height * scale_y)))
+        return self.batch[:len(frames)], transforms
+
+    def get_shape(self, height, width) :
+        if self.shape is not None :
+            return self.shape
+        if not self.stride :
+            return self.size, self.size
+        ratio = min(self.size / height, self.size / width)
+        return self._align(int(round(height * ratio)), int(round(width * ratio)))
+
+    #The smallest input with sides multiple of the stride containing a resized frame
+    def _align(self, new_height, new_width) :
+        return -(-new_height // self.stride) * self.stride, -(-new_width // self.stride) * self.stride
+
+    def _allocate(self, nbr_frames, height, width) :
+        self.batch = np.empty((nbr_frames, 3, height, width), dtype=np.float32)
+        self.padded = [np.empty((height, width, 3), dtype=np.uint8) for _ in range(nbr_frames)]
+        self.layouts = [None] * nbr_frames
+
+
+#Filter, NMS and scale back the raw YOLOv5 output (batch, boxes, 5 + classes), rows [cx, cy, w, h, objectness, classes...]
+def postprocess(prediction, transforms, settings) :
+    results = []
+    for output, ((factor_x, factor_y), (pad_x, pad_y), (max_x, max_y)) in zip(prediction, transforms) :
+        output = output[output[:, 4] > settings["conf"]]
+        class_scores = output[:, 5:] * output[:, 4:5]
+        classes = class_scores.argmax(axis=1)
+        confidences = class_scores[np.arange(len(output)), classes]
+        keep = confidences > settings["conf"]
+        if settings["classes"] is not None :
+            keep &= np.isin(classes, settings["classes"])
+        output, classes, confidences = output[keep], classes[keep], confidences[keep]
+        #cx, cy, w, h to x1, y1, x2, y2
+        boxes = np.empty((len(output), 4), dtype=np.float32)
+        boxes[:, 0:2] = output[:, 0:2] - output[:, 2:4] / 2
+        boxes[:, 2:4] = output[:, 0:2] + output[:, 2:4] / 2
+        #Boxes of different classes never overlap in the NMS, unless agnostic
+        offsets = 0 if settings["agnostic"] else classes[:, None] * 4096
+        nms_boxes = boxes + offsets
+        index = cv2.dnn.NMSBoxes((np.hstack((nms_boxes[:, 0:2], nms_boxes[:, 2:4] - nms_boxes[:, 0:2]))).tolist(),
+                                 confidences.tolist(), settings["conf"], settings["iou"])
+        index = np.asarray(index, dtype=np.int64).reshape(-1)[:settings["max_det"]]
+        boxes = boxes[index]
+        #Letterbox coordinates to frame coordinates, at the scale of the frame
+        boxes[:, [0, 2]] = ((boxes[:, [0, 2]] - pad_x) * factor_x).clip(0, max_x)
+        boxes[:, [1, 3]] = ((boxes[:, [1, 3]] - pad_y) * factor_y).clip(0, max_y)
+        results.append(np.hstack((boxes, confidences[index, None], classes[index, None])).astype(np.float64))
+    return results
+
+
+####################################################################################################
+#Hub_Backend : The YOLOv5 PyTorch hub model, in eager mode. The frames are given as a tensor made by the
+#              Preprocessor, so AutoShape doesn't resize and convert them again, with an input rectangle
+#              multiple of the stride of the model as AutoShape.
+#Parameters :
+#   bool local : Indicate if the model is local or loaded from Yolo.
+#   String yolo_path : The path to Yolo local librairie.
+#   bool quantize : Apply a dynamic int8 quantization. Only the Linear layers are quantized by PyTorch,
+#                   the convolutions of YOLOv5 stay in float.
+####################################################################################################
+class Hub_Backend :
+    def __init__(self, local, yolo_path, model_path, settings, size, quantize = False) :
+        import torch
+        #Normalise the model path.
+        yolo_path = os.path.normpath(yolo_path)
+        if local :
+            self.model = torch.hub.load(yolo_path, 'custom', path=model_path, source='local')
+        else :
+            self.model = torch.hub.load('ultralytics/yolov5', 'yolov5l6', pretrained=True)
+        self.model.eval()
+        if quantize :
+            self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+        self.model.conf = settings["conf"]  # NMS confidence threshold
+        self.model.iou = settings["iou"]  # NMS IoU threshold
+        self.model.agnostic = settings["agnostic"]  # NMS class-agnostic
+        self.model.multi_label = False  # NMS multiple labels per box
+        self.model.max_det = settings["max_det"]  # maximum number of detections per image
+        self.model.classes = settings["classes"]
+        self.settings = settings
+        self.size = size
+        self.preprocessor = Preprocessor(size, int(torch.as_tensor(self.model.stride).max()))
+
+    def infer(self, frames, scales = None) :
+        import torch
+        batch, transforms = self.preprocessor(frames, scales)
+        #Given a tensor, AutoShape run only the network
+        with torch.inference_mode() :
+            prediction = self.model(torch.from_numpy(batch))
+        if isinstance(prediction, (tuple, list)) :
+            prediction = prediction[0]
+        return postprocess(prediction.cpu().numpy(), transforms, self.settings)
+
+    #The same model with another input size
+    def with_size(self, size) :
+        backend = copy.copy(self)
+        backend.size = size
+        backend.preprocessor = Preprocessor(size, self.preprocessor.stride)
+        return backend
+
+
+####################################################################################################
+#TorchScript_Backend : A YOLOv5 model exported with TorchScript (export.py --include torchscript).
+#                      The input is the shape of the export, written in the model by YOLOv5 (config.txt),
+#                      else a square of size.
+####################################################################################################
+class TorchScript_Backend :
+    def __init__(self, model_path, settings, size) :
+        import torch
+        extra_files = {"config.txt" : ""}
+        self.model = torch.jit.load(model_path, map_location="cpu", _extra_files=extra_files)
+        self.model.eval()
+        self.settings = settings
+        self.size = size
+        shape = json.loads(extra_files["config.txt"]).get("shape") if extra_files["config.txt"] else None
+        #The traced model only accept the shape of the trace, [batch, channels, height, width]
+        self.preprocessor = Preprocessor(size, shape=shape[2:] if shape else None)
+
+    def infer(self, frames, scales = None) :
+        import torch
+        batch, transforms = self.preprocessor(frames, scales)
+        with torch.inference_mode() :
+            prediction = self.model(torch.from_numpy(batch))
+        #The exported model return a tuple (prediction, ...)
+        if isinstance(prediction, (tuple, list)) :
+            prediction = prediction[0]
+        return postprocess(prediction.numpy(), transforms, self.settings)
+
+
+#Path of the TorchScript artifact of a hub model for an input size and a frame size (width, height)
+def cached_path(model_path, size, frame_size = None) :
+    if frame_size is None :
+        return f'{os.path.splitext(model_path)[0]}.{size}.torchscript'
+    return f'{os.path.splitext(model_path)[0]}.{size}.{frame_size[0]}x{frame_size[1]}.torchscript'
+
+
+#Serialize the network of a hub model with TorchScript for the input shape (height, width), as YOLOv5 export.py
+def export_torchscript(hub_backend, path, shape) :
+    import torch
+    #AutoShape -> DetectMultiBackend -> DetectionModel
+    network = hub_backend.model.model.model
+    #The Detect layer return only the predictions during the export
+    detect_layers = [module for module in network.modules() if hasattr(module, "export")]
+    try :
+        for module in detect_layers :
+            module.export = True
+        with torch.no_grad() :
+            traced = torch.jit.trace(network, torch.zeros(1, 3, *shape), strict=False)
+    finally :
+        for module in detect_layers :
+            module.export = False
+    #Written beside then moved, an interrupted export never leave a broken artifact. One file per process, the
+    #workers of an Inference_Pool export at the same time on the first launch.
+    temporary = f'{path}.{os.getpid()}.tmp'
+    traced.save(temporary, _extra_files={"config.txt" : json.dumps({"shape" : [1, 3, *shape]})})
+    os.replace(temporary, path)
+
+
+#Cached backend : The hub model, loaded once with torch.hub and serialized with TorchScript next to the model
+#(<model>.<size>.<width>x<height>.torchscript), then used by a TorchScript_Backend. The next launches load only
+#the artifact, without the YOLOv5 code and the hub. It's traced on the same stride-aligned rectangle as the hub
+#model for frames of frame_size (width, height), a square of size if it's None. An artifact that can't be loaded
+#is made again. If the export fails, the Hub_Backend is returned.
+def cached_backend(local, yolo_path, model_path, settings, size, frame_size = None) :
+    path = cached_path(model_path, size, frame_size)
+    #An artifact older than the model is made again
+    if os.path.exists(path) and (not os.path.exists(model_path) or os.path.getmtime(path) >= os.path.getmtime(model_path)) :
+        try :
+            return TorchScript_Backend(path, settings, size)
+        except Exception as e :
+            logger.warning('The cached model %s could not be loaded, it is made again : %s', path, e)
+    hub_backend = Hub_Backend(local, yolo_path, model_path, settings, size)
+    shape = (size, size) if frame_size is None else hub_backend.preprocessor.get_shape(frame_size[1], frame_size[0])
+    try :
+        export_torchscript(hub_backend, path, shape)
+    except Exception as e :
+        logger.warning('The model could not be cached, the hub model is used : %s', e)
+        return hub_backend
+    logger.info('Model cached in %s', path)
+    return TorchScript_Backend(path, settings, size)
+
+
+####################################################################################################
+#Onnx_Backend : A YOLOv5 model exported with ONNX (export.py --include onnx), run by ONNX Runtime on the CPU.
+#Parameters :
+#   bool quantize : Use a dynamic int8 quantization of the model, saved next to it (<model>.int8.onnx).
+#   int threads : The number of intra-op threads, 0 for the ONNX Runtime default.
+####################################################################################################
+class Onnx_Backend :
+    def __init__(self, model_path, settings, size, quantize = False, threads = 0) :
+        try :
+            import onnxruntime
+        except ImportError as e :
+            raise ImportError("The onnx backend needs onnxruntime : pip install onnxruntime") from e
+        if quantize :
+            model_path = self.quantize(model_path)
+        options = onnxruntime.SessionOptions()
+        if threads > 0 :
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        #A fixed batch size of 1 if the model was not exported with --dynamic
+        self.dynamic_batch = not isinstance(self.session.get_inputs()[0].shape[0], int)
+        input_size = self.session.get_inputs()[0].shape[2]
+        self.size = input_size if isinstance(input_size, int) else size
+        self.settings = settings
+        self.preprocessor = Preprocessor(self.size)
+
+    #Quantize the model once, the quantized model is reused by the next launches
+    def quantize(self, model_path) :
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantized_path = os.path.splitext(model_path)[0] + ".int8.onnx"
+        if not os.path.exists(quantized_path) :
+            quantize_dynamic(model_path, quantized_path, weight_type=QuantType.QUInt8)
+        return quantized_path
+
+    def infer(self, frames, scales = None) :
+        batch, transforms = self.preprocessor(frames, scales)
+        if self.dynamic_batch :
+            prediction = self.session.run(None, {self.input_name : batch})[0]
+        else :
+            prediction = np.concatenate([self.session.run(None, {self.input_name : image[None]})[0] for image in batch])
+        return postprocess(prediction, transforms, self.settings)
+
+
+####################################################################################################
+#OpenVINO_Backend : A YOLOv5 model exported with OpenVINO (export.py --include openvino), on the CPU.
+#Parameters :
+#   int threads : The number of inference threads, 0 for the OpenVINO default.
+####################################################################################################
+class OpenVINO_Backend :
+    def __init__(self, model_path, settings, size, threads = 0) :
+        try :
+            from openvino.runtime import Core
+        except ImportError as e :
+            raise ImportError("The openvino backend needs openvino : pip install openvino") from e
+        config = {"INFERENCE_NUM_THREADS" : str(threads)} if threads > 0 else {}
+        core = Core()
+        model = core.read_model(model_path)
+        self.model = core.compile_model(model, "CPU", config)
+        self.output = self.model.output(0)
+        input_size = model.inputs[0].get_partial_shape()[2]
+        self.size = input_size.get_length() if input_size.is_static else size
+        self.settings = settings
+        self.preprocessor = Preprocessor(self.size)
+
+    def infer(self, frames, scales = None) :
+        batch, transforms = self.preprocessor(frames, scales)
+        prediction = np.concatenate([self.model([image[None]])[self.output] for image in batch])
+        return postprocess(prediction, transforms, self.settings)
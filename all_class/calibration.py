@@ -0,0 +1,110 @@
+import threading
+import time
+import cv2
+import numpy as np
+
+
+#Brightness image accumulated over the frames
+MEAN = "mean"
+MAX = "max"
+
+
+####################################################################################################
+#Calibration_Worker : Thread calibrating the detection's zone in the background, from the mean (or max)
+#                     brightness of several raw frames, so one frame of glare doesn't move the limits
+#                     and the main loop never wait for it.
+#Parameters :
+#   IO io : The IO object receiving the new limits.
+#   int nbr_frames : The number of frames accumulated for one calibration.
+#   int nbr_groupe : The number of groups of pixels to keep.
+#   int tresh_percentage : The percentage of the brightest pixels to set the Threshold.
+#   String mode : The brightness image accumulated, "mean" or "max".
+#   bool calibration_draw : Indicate if a visual output of the calibration is needed.
+#Attributes :
+#   self.condition : Condition protecting the frame slot and waking the thread.
+#   self.frame : The last raw frame not yet accumulated.
+#   self.remaining : The number of frames still needed by the current calibration, 0 if none.
+#   self.calibration_count : The number of calibrations made.
+#Methods :
+#   request(delay) :
+#       Start a calibration on the next frames, unless one is running or the last one is too recent.
+#       delay : The delay in minutes beetween each calibration.
+#   feed(frame) :
+#       Give a raw frame to the calibration, does nothing if no calibration is running.
+#       frame : The frame, before any drawing. Resized to the screen only while a calibration is running.
+#   configure(nbr_frames, nbr_groupe, tresh_percentage, mode, calibration_draw) :
+#       Change the parameters while running, used from the next calibration.
+####################################################################################################
+class Calibration_Worker(threading.Thread) :
+    def __init__(self, io, nbr_frames, nbr_groupe, tresh_percentage, mode = MEAN, calibration_draw = False) :
+        if mode not in (MEAN, MAX) :
+            raise ValueError(f'Unknown calibration mode : {mode}')
+        super().__init__(name="calibration", daemon=True)
+        self.io = io
+        self.nbr_frames = max(nbr_frames, 1)
+        self.nbr_groupe = nbr_groupe
+        self.tresh_percentage = tresh_percentage
+        self.mode = mode
+        self.calibration_draw = calibration_draw
+        self._next_mode = mode
+        self.condition = threading.Condition()
+        self.frame = None
+        self.remaining = 0
+        self.calibration_count = 0
+        self.start()
+
+    def configure(self, nbr_frames, nbr_groupe, tresh_percentage, mode = MEAN, calibration_draw = False) :
+        if mode not in (MEAN, MAX) :
+            raise ValueError(f'Unknown calibration mode : {mode}')
+        with self.condition :
+            self.nbr_frames = max(nbr_frames, 1)
+            self.nbr_groupe = nbr_groupe
+            self.tresh_percentage = tresh_percentage
+            self.calibration_draw = calibration_draw
+            #Applied by the next request, the accumulation of a running calibration keep its mode
+            self._next_mode = mode
+
+    def request(self, delay) :
+        with self.condition :
+            if self.remaining > 0 or time.time() - self.io.last_calibrate_time < delay * 60 :
+                return False
+            self.remaining = self.nbr_frames
+            self.mode = self._next_mode
+            return True
+
+    def feed(self, frame) :
+        #Read without the lock, the main loop pays nothing outside of a calibration
+        if self.remaining == 0 :
+            return
+        with self.condition :
+            if self.remaining > 0 :
+                #Replace the last frame if the thread is late, a copy at the size of the screen
+                self.frame = self.io.screen_frame(frame, True)
+                self.condition.notify()
+
+    def run(self) :
+        accumulator = None
+        count = 0
+        while True :
+            with self.condition :
+                while self.frame is None :
+                    self.condition.wait()
+                frame, self.frame = self.frame, None
+                self.remaining -= 1
+                done = self.remaining == 0
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            if count == 0 :
+                accumulator = gray.astype(np.float32) if self.mode == MEAN else gray
+            elif self.mode == MEAN :
+                cv2.accumulate(gray, accumulator)
+            else :
+                cv2.max(accumulator, gray, dst=accumulator)
+            count += 1
+            if done :
+                if self.mode == MEAN :
+                    accumulator = (accumulator / count).astype(np.uint8)
+                limits = self.io.find_limits(accumulator, self.nbr_groupe, self.tresh_percentage,
+                                             frame if self.calibration_draw else None)
+                self.io.set_calibration(*limits)
+                self.calibration_count += 1
+                count = 0
@@ -0,0 +1,186 @@
+import logging
+import queue
+import threading
+import time
+
+from all_class.io import IO
+from all_class.tracked_points import Tracked_Points
+from all_class.detection_process import Detection_Process
+from all_class.moving import Moving
+from all_class.draw import Draw
+from all_class.calibration import Calibration_Worker
+from all_class.detection_gate import Detection_Gate
+
+
+logger = logging.getLogger(__name__)
+
+#Frames waiting in front of the processing for each camera, only the last one
+QUEUE_SIZE = 1
+
+
+####################################################################################################
+#Camera : Thread capturing the frames of one camera, keeping only the last one for the processing, with the
+#         tracker, the calibration, the processing and the drawing of this camera. The frames are submitted to
+#         the model shared by all the cameras when the processing takes them, never for a frame dropped.
+#Parameters :
+#   int index : The number of the camera, used for its window and its output file.
+#   String input_name : The input of the camera (-i).
+#   String output_name : The output file of all the cameras (-o), _<index> is added. None without output.
+#   Batch_Model batch_model : The shared model, running the frames of all the cameras in one batch.
+#   dict settings : The configuration (see all_class/config.py).
+#   list calibration : The manual calibration [calibration_x, calibration_y] of this camera.
+#Attributes :
+#   self.io : The input and output of the camera.
+#   self.gate : The filter of the detections before the tracker of this camera.
+#   self.items : The last frame (frame, timestamp), None at the end.
+#Methods :
+#   start() :
+#       Start the capture, when the shared model is ready. The camera is connected by __init__.
+#   get() :
+#       Return the next item, None at the end of the video.
+#   detect(item) :
+#       Submit the frame of an item to the shared model if the tracker needs a detection,
+#       return (frame, timestamp, Future of the detections or None).
+#   track(item, settings) :
+#       Track the detections of an item, return the informations (Detection_Process) and the drawing informations.
+#   output(drawing, client_info, settings) :
+#       Feed the calibration, draw, display and record the frame.
+#   configure(old, settings) :
+#       Apply a new configuration, between two frames.
+#   stop() :
+#       Stop the capture.
+####################################################################################################
+class Camera(threading.Thread) :
+    def __init__(self, index, input_name, output_name, batch_model, settings, calibration) :
+        super().__init__(name=f'camera_{index}', daemon=True)
+        self.index = index
+        self.batch_model = batch_model
+        args = ["-i", input_name]
+        if output_name :
+            args += ["-o", output_name.replace(".mp4", "") + f'_{index}.mp4']
+        #The frame of the queue, the frame put by the thread and the frame processed, until they are freed
+        self.io = IO(args, settings["SCREEN_WIDTH"], settings["SCREEN_HEIGHT"], settings["WRITER_QUEUE"],
+                     settings["WRITER_POLICY"], settings["SEGMENT_MINUTES"], QUEUE_SIZE + 4)
+        self.io.window_name = f'Camera {index}'
+        self.io.set_manual_calibration(*calibration)
+        self.tracked_points = Tracked_Points(settings["MODE"], settings["DISTANCE_THRESHOLD_BBOX"], settings["DETECT_EVERY"],
+                                             settings["DETECTION_BUDGET"], settings["MAX_DETECT_EVERY"])
+        self.detection_process = Detection_Process(settings["SCREEN_WIDTH"], settings["SCREEN_HEIGHT"])
+        self.moving = Moving(settings["DIFF_DIST"], settings["NBR_FRAME"], settings["MOVE_METRIC"])
+        self.draw = Draw(settings["DRAW_EVERY"])
+        self.gate = Detection_Gate(settings["GATE_MARGIN"], settings["GATE_MODE"], settings["GATE_WEIGHT"],
+                                   settings["GATE_IOU"], settings["GATE_LOW_CONFIDENCE"])
+        self.calibration_worker = Calibration_Worker(self.io, settings["CALIBRATION_FRAMES"], settings["NBR_GROUPE"],
+                                                     settings["TRESH_PERCENTAGE"], settings["CALIBRATION_MODE"],
+                                                     settings["CALIBRATION_DRAW"])
+        self.items = queue.Queue(maxsize=QUEUE_SIZE)
+        self.stop_event = threading.Event()
+
+    def run(self) :
+        while not self.stop_event.is_set() :
+            #Catching error made by reconnection
+            try :
+                ret, frame = self.io.get_Frame()
+            except TypeError as e :
+                logger.warning("Camera %d error : %s. The capture will soon restart.", self.index, e)
+                time.sleep(10)
+                continue
+            if not ret :
+                logger.warning("Camera %d : No Frame", self.index)
+                if not self.io.live :
+                    break
+                time.sleep(10)
+                continue
+            self._put((frame, self.io.frame_timestamp))
+        self._put(None, True)
+
+    #A live camera drop its oldest frame when the processing is late, a video wait
+    def _put(self, item, block = False) :
+        if block or not self.io.live :
+            self.items.put(item)
+            return
+        while True :
+            try :
+                self.items.put_nowait(item)
+                return
+            except queue.Full :
+                try :
+                    dropped = self.items.get_nowait()
+                except queue.Empty :
+                    continue
+                self.io.free_frame(dropped[0])
+
+    def get(self) :
+        return self.items.get()
+
+    def detect(self, item) :
+        frame, timestamp = item
+        detections = None
+        if self.tracked_points.need_detection() :
+            #The detections are given on the screen, the frame is only resized for the input of the model
+            detections = self.batch_model.submit(frame, self.io.get_scale(frame))
+        return frame, timestamp, detections
+
+    def track(self, item, settings) :
+        frame, timestamp, detections = item
+        #Both limits of the same calibration, the calibration can change at any time
+        calibration_x, calibration_y = self.io.get_calibration()
+        cal_x = self.io.get_formated_calibration_x(calibration_x)
+        cal_y = self.io.get_formated_calibration_y(calibration_y)
+        #A frame lost by the model is estimated like a skipped one
+        if detections is not None :
+            try :
+                detections = detections.result()
+            except Exception as e :
+                logger.error("Camera %d : No detections for this frame : %s", self.index, e)
+                detections = None
+        if detections is None :
+            tracked_objects, raw = self.tracked_points.predict()
+        else :
+            if settings["GATE"] :
+                detections = self.gate.filter(detections, cal_x, cal_y, len(self.tracked_points.tracker.tracked_objects))
+            tracked_objects, raw = self.tracked_points.yolo_detections_to_tracked_points(detections)
+        informations = self.detection_process.get_final_objects(tracked_objects, settings["MIN_AGE"],
+                                                                settings["MIN_SCORE_NORFAIR"], self.moving,
+                                                                cal_x, cal_y, settings["OUT_ID"])
+        return informations, (frame, self.detection_process.draw_info, raw, tracked_objects, calibration_x, calibration_y)
+
+    def output(self, drawing, client_info, settings) :
+        frame, draw_info, raw, tracked_objects, calibration_x, calibration_y = drawing
+        #The calibration needs the frame before the drawing
+        self.calibration_worker.feed(frame)
+        display = not settings["HEADLESS"] and self.draw.should_draw()
+        if display :
+            #Resized to the screen only when it's drawn
+            frame = self.draw.draw_info(self.io.screen_frame(frame), draw_info, client_info, calibration_x, calibration_y,
+                                        settings["OUT_ID"], raw, tracked_objects, settings["DRAW_DEBUG"])
+            self.io.live_output(frame)
+        if settings["RECORD"] :
+            self.io.local_output(frame)
+        #The frame is not used anymore, its buffer can take a new frame
+        self.io.free_frame(drawing[0])
+
+    def configure(self, old, settings) :
+        keys = ("MODE", "DISTANCE_THRESHOLD_BBOX", "DETECT_EVERY", "DETECTION_BUDGET", "MAX_DETECT_EVERY")
+        if any(old[key] != settings[key] for key in keys) :
+            self.tracked_points.configure(*(settings[key] for key in keys))
+        keys = ("DIFF_DIST", "NBR_FRAME", "MOVE_METRIC")
+        if any(old[key] != settings[key] for key in keys) :
+            self.moving = Moving(*(settings[key] for key in keys))
+        self.draw.draw_every = max(settings["DRAW_EVERY"], 1)
+        keys = ("GATE_MARGIN", "GATE_MODE", "GATE_WEIGHT", "GATE_IOU", "GATE_LOW_CONFIDENCE")
+        if any(old[key] != settings[key] for key in keys) :
+            self.gate.configure(*(settings[key] for key in keys))
+        keys = ("CALIBRATION_FRAMES", "NBR_GROUPE", "TRESH_PERCENTAGE", "CALIBRATION_MODE", "CALIBRATION_DRAW")
+        if any(old[key] != settings[key] for key in keys) :
+            self.calibration_worker.configure(*(settings[key] for key in keys))
+
+    def stop(self) :
+        self.stop_event.set()
+        #Unblock the capture if it waits for the processing
+        while not self.items.empty() :
+            item = self.items.get_nowait()
+            if item is not None :
+                self.io.free_frame(item[0])
+        self.join(timeout=1)
+        self.io.close()
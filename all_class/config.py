@@ -0,0 +1,417 @@
+import argparse
+import json
+import logging
+import os
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+#Default value of every constant, a configuration file only needs the changed ones
+DEFAULTS = {
+
+    #Delay in frames before launching the calibration
+    "CALIBRATION_DELAY" : 30,
+    #Use the manual calibration below instead of the automatic one.
+    "MANUAL_CALIBRATION" : True,
+    #From 0 on the left, from 1280 on the right
+    "MANUAL_CALIBRATION_X" : [[20, 400], [1260, 400]],
+    #From 0
+    "MANUAL_CALIBRATION_Y" : [[640, 440], [640, 650]],
+
+    #IO.CALIBRATE########################################################################
+    #The number of groups of pixels to keep.
+    "NBR_GROUPE" : 2,
+    #The delay in minutes beetween each calibration.
+    "DELAY" : 15.0,
+    #Indicate if a visual output of the calibration is needed.
+    "CALIBRATION_DRAW" : True,
+    #The percentage of the brightest pixels to set the Threshold.
+    "TRESH_PERCENTAGE" : 5,
+    #The number of frames accumulated for one calibration.
+    "CALIBRATION_FRAMES" : 10,
+    #The brightness image accumulated over the frames, "mean" or "max".
+    "CALIBRATION_MODE" : "mean",
+    #Screen Width
+    "SCREEN_WIDTH" : 1280,
+    #Screen Height
+    "SCREEN_HEIGHT" : 720,
+
+    #IO.LOCAL_OUTPUT#####################################################################
+    #Record the frames in the output file (-o).
+    "RECORD" : False,
+    #The maximum number of frames waiting to be encoded.
+    "WRITER_QUEUE" : 64,
+    #What to do when the encoding is late, "block" (every frame is recorded) or "drop" (for a long live recording).
+    "WRITER_POLICY" : "block",
+    #The duration in minutes of each recorded file (<output>_000.mp4, ...), 0 for one file named as the output.
+    "SEGMENT_MINUTES" : 0.0,
+
+    #MODEL###############################################################################
+    #Indicate if the model is local or loaded from Yolo.
+    "LOCAL" : True,
+    #Model confidence
+    "MODEL_CONFIDENCE" : 0.1,
+    #The path to Yolo local librairie.
+    "YOLO_PATH" : r'../local_lib/yolov5',
+    #The path to the Yolo local model (or to the exported model for the other backends).
+    "MODEL_PATH" : r'/model/yolov5l6.pt',
+    #The runtime of the model, "cached" (the hub model serialized on the first launch, then loaded in seconds),
+    #"hub", "torchscript", "onnx" or "openvino".
+    "BACKEND" : "cached",
+    #The input size of the model (for the exported models, the size used by the export).
+    "MODEL_SIZE" : 640,
+    #Other input sizes loaded and warmed at the start (for example [640, 960, 1280]), the size is changed between two
+    #frames to hold TARGET_FPS. Empty to keep MODEL_SIZE. The exported models need "{size}" in MODEL_PATH.
+    "ADAPTIVE_SIZES" : [],
+    #The frame rate held by changing the input size of the model.
+    "TARGET_FPS" : 15,
+    #The fraction of the time of a frame kept free when the input size grows, so it doesn't go back and forth.
+    "ADAPT_MARGIN" : 0.2,
+    #The number of frames the frame rate must be too low (or high enough) before a change of the input size.
+    "ADAPT_FRAMES" : 30,
+    #Use a dynamic int8 quantization of the model.
+    "QUANTIZE" : False,
+    #The number of threads used by the model on the CPU, 0 for the default.
+    "MODEL_THREADS" : 0,
+    #The maximum number of frames in one forward pass (1 to disable batching).
+    "BATCH_SIZE" : 1,
+    #The maximum time in seconds to wait for the other frames of a batch.
+    "BATCH_WAIT" : 0.05,
+    #The number of processes running the model, each with its own copy of it (0 to run it in this process).
+    "INFERENCE_WORKERS" : 0,
+
+    #TRACKED_POINTS######################################################################
+    #Mode of tracking (bbox or centroid).
+    "MODE" : "bbox",
+    #Dstance beetween 2 detections for Norfair to accept the tracking.
+    "DISTANCE_THRESHOLD_BBOX" : 0.7,
+    #Run the detector every DETECT_EVERY frames, the tracker estimates the positions in between.
+    "DETECT_EVERY" : 1,
+    #If above 0, DETECT_EVERY is adapted to keep the detector's time per frame under this budget in seconds.
+    "DETECTION_BUDGET" : 0.0,
+    #The maximum value of DETECT_EVERY when it's adapted.
+    "MAX_DETECT_EVERY" : 4,
+    #Run the model only on the calibrated zone (plus the margins) instead of the whole frame. Only with the "hub"
+    #backend, the other ones run on a fixed input shape and use the whole frame.
+    "ROI" : False,
+    #The margin in px around the calibrated zone.
+    "ROI_MARGIN" : 50,
+    #The margin in px above the calibrated zone, for the body of the people whose feet are inside.
+    "ROI_TOP_MARGIN" : 300,
+    #Filter the detections before the tracker (zone and overlap), the passers-by around the installation cost nothing.
+    "GATE" : False,
+    #The margin in px around the calibrated zone, the detections outside are gated.
+    "GATE_MARGIN" : 50,
+    #"drop" to remove the detections outside the zone, "weight" to multiply their confidence by GATE_WEIGHT.
+    "GATE_MODE" : "drop",
+    #The factor of the confidence of the detections outside the zone in "weight" mode.
+    "GATE_WEIGHT" : 0.5,
+    #The IoU above which a low confidence box is removed by a more confident box overlapping it.
+    "GATE_IOU" : 0.7,
+    #The confidence under which a box can be removed by the overlap.
+    "GATE_LOW_CONFIDENCE" : 0.3,
+
+    #DETECTION_STORE#####################################################################
+    #Directory where the detections of each frame are recorded (an existing store is replaced), None to disable it.
+    "RECORD_DETECTIONS" : None,
+    #Directory of recorded detections used instead of the model (same video), None to use the model.
+    "REPLAY_DETECTIONS" : None,
+
+    #DETECTION_PROCESS###################################################################
+    #DETECTION_PROCESS.GET_FINAL_OBJECTS
+    #The minimum number of frame for an object to be considered alive.
+    "MIN_AGE" : 2,
+    #The minimum Norfair score for an object to be considered.
+    "MIN_SCORE_NORFAIR" : 0.05,
+    #The special value for the person out of the detection
+    "OUT_ID" : -137,
+
+    #OSC_CLIENT##########################################################################
+    #The maximum number of people tracked simultanously (Used also for init Drawing)
+    "NBR_PEOPLE_MAX" : 10,
+    #The number of informations for each tracked person.
+    "NBR_INFO" : 3,
+    #The IP of the client. Default : 127.0.0.1
+    "IP" : "10.0.0.1",
+    #The port of the client. Default : 5005
+    "PORT" : 8000,
+    #OSC_CLIENT.SEND_INFO
+    #The number of frames until a tracked person effectively disappear to let the installation the time to adapt.
+    "COUNTDOWN" : 36,
+    #Distance offset in % from the start/end of the installation to accept that a person left the detection.
+    "LEAVING_OFFSET" : 1.0,
+    #Time difference in seconds after which we suppress a cached person definitively.
+    "TIME_TO_LET_GO" : 3.0,
+    #Distance offset in % beetween the old and the new detection to accept that it was the same person
+    #Also offset in % to accept a new detection.
+    "APPEAR_OFFSET" : 5.0,
+    #"message" (one datagram per information), "bundle" (one bundle per frame) or "delta" (only the changed slots).
+    "OSC_MODE" : "message",
+    #In delta mode, the number of frames beetween two sendings of all the slots.
+    "KEYFRAME_INTERVAL" : 30,
+
+    #LOGGING#############################################################################
+    #The level of the diagnostics, "INFO" log the startup and the calibrations, "DEBUG" print the slots and the cache on every frame.
+    "LOG_LEVEL" : "INFO",
+
+    #METRICS#############################################################################
+    #Collect the stage latencies, queue depths, tracks, slots, reconnections and frame age (no cost if False).
+    "METRICS" : False,
+    #The local port of the HTTP endpoint (/metrics for Prometheus, /json), 0 to disable it.
+    "METRICS_PORT" : 0,
+    #The file where a JSON snapshot is written every METRICS_DELAY seconds, None to disable it.
+    "METRICS_FILE" : None,
+    #The delay in seconds beetween each snapshot and each summary in the log (INFO level).
+    "METRICS_DELAY" : 10,
+
+    #MOVING##############################################################################
+    #The difference in px which is considered as a move.
+    "DIFF_DIST" : 3.0,
+    #The number of frame to use for the estimation of the deplacement.
+    "NBR_FRAME" : 5,
+    #The deplacement used, "x", "y" or "euclidean".
+    "MOVE_METRIC" : "x",
+
+    #DRAW##############################################################################
+    #Display all informations of the models.
+    "DRAW_DEBUG" : True,
+    #No drawing and no window, for the production.
+    "HEADLESS" : False,
+    #Draw and display only one frame every DRAW_EVERY frames.
+    "DRAW_EVERY" : 1,
+
+    #MULTI_CAMERA########################################################################
+    #The part of the installation seen by each camera (-i repeated), [start, end] in % of the installation for the
+    #calibrated zone of the camera. Empty to split the installation evenly beetween the cameras.
+    "CAMERA_ZONES" : [],
+    #Distance in % of the installation under which two cameras see the same person (the overlap of their views).
+    "HANDOFF_DISTANCE" : 3.0,
+    #The manual calibration [MANUAL_CALIBRATION_X, MANUAL_CALIBRATION_Y] of each camera, empty to use the same for all.
+    "CAMERA_CALIBRATIONS" : [],
+
+    #PIPELINE############################################################################
+    #Run capture, inference, tracking and output each in its own thread.
+    "PIPELINE" : False,
+    #The maximum number of frames waiting in front of each stage.
+    "QUEUE_SIZE" : 2,
+    #What to do when a stage is late, "block" or "drop_oldest". A video file always uses "block".
+    "QUEUE_POLICY" : "drop_oldest",
+    #The delay in seconds beetween each throughput report of the stages.
+    "REPORT_DELAY" : 10
+}
+
+#Keys applied by loading a new model in the background, the current one is used until the new one is ready
+MODEL_KEYS = {"LOCAL", "MODEL_CONFIDENCE", "YOLO_PATH", "MODEL_PATH", "BACKEND", "MODEL_SIZE", "ADAPTIVE_SIZES", "QUANTIZE",
+              "MODEL_THREADS"}
+#Keys sizing the buffers, the threads and the outputs, only read at the start
+RESTART_KEYS = {"SCREEN_WIDTH", "SCREEN_HEIGHT", "WRITER_QUEUE", "WRITER_POLICY", "SEGMENT_MINUTES", "BATCH_SIZE",
+                "INFERENCE_WORKERS", "RECORD_DETECTIONS", "REPLAY_DETECTIONS", "NBR_PEOPLE_MAX", "NBR_INFO", "METRICS",
+                "METRICS_PORT", "METRICS_FILE", "METRICS_DELAY", "PIPELINE", "QUEUE_SIZE", "QUEUE_POLICY", "REPORT_DELAY"}
+
+#The accepted values of the constants with a fixed set of choices
+CHOICES = {
+    "CALIBRATION_MODE" : ("mean", "max"),
+    "WRITER_POLICY" : ("block", "drop"),
+    "BACKEND" : ("cached", "hub", "torchscript", "onnx", "openvino"),
+    "MODE" : ("bbox", "centroid"),
+    "GATE_MODE" : ("drop", "weight"),
+    "OSC_MODE" : ("message", "bundle", "delta"),
+    "LOG_LEVEL" : ("CRITICAL", "ERROR", "WARNING", "INFO", "DEBUG", "NOTSET"),
+    "MOVE_METRIC" : ("x", "y", "euclidean"),
+    "QUEUE_POLICY" : ("block", "drop_oldest")
+}
+
+
+#Return True if value is an int or a float
+def _is_number(value) :
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+#Return True if value is a manual calibration, two points [[x, y], [x, y]]
+def _is_calibration(value) :
+    return (isinstance(value, list) and len(value) == 2 and
+            all(isinstance(point, list) and len(point) == 2 and all(map(_is_number, point)) for point in value))
+
+
+#The range or the shape of the values of the constants, (function returning True if the value is valid, description)
+LIMITS = {
+    "SCREEN_WIDTH" : (lambda value : value > 0, "a value above 0"),
+    "SCREEN_HEIGHT" : (lambda value : value > 0, "a value above 0"),
+    "MODEL_SIZE" : (lambda value : value > 0, "a value above 0"),
+    "TARGET_FPS" : (lambda value : value > 0, "a value above 0"),
+    "BATCH_SIZE" : (lambda value : value > 0, "a value above 0"),
+    "QUEUE_SIZE" : (lambda value : value > 0, "a value above 0"),
+    "WRITER_QUEUE" : (lambda value : value > 0, "a value above 0"),
+    "CALIBRATION_FRAMES" : (lambda value : value > 0, "a value above 0"),
+    "NBR_GROUPE" : (lambda value : value > 0, "a value above 0"),
+    "NBR_PEOPLE_MAX" : (lambda value : value > 0, "a value above 0"),
+    "NBR_INFO" : (lambda value : value > 0, "a value above 0"),
+    "NBR_FRAME" : (lambda value : value > 0, "a value above 0"),
+    "KEYFRAME_INTERVAL" : (lambda value : value > 0, "a value above 0"),
+    "METRICS_DELAY" : (lambda value : value > 0, "a value above 0"),
+    "REPORT_DELAY" : (lambda value : value >= 0, "a value of 0 or more"),
+    "SEGMENT_MINUTES" : (lambda value : value >= 0, "a value of 0 or more"),
+    "MODEL_THREADS" : (lambda value : value >= 0, "a value of 0 or more"),
+    "BATCH_WAIT" : (lambda value : value >= 0, "a value of 0 or more"),
+    "INFERENCE_WORKERS" : (lambda value : value >= 0, "a value of 0 or more"),
+    "DETECTION_BUDGET" : (lambda value : value >= 0, "a value of 0 or more"),
+    "ADAPT_FRAMES" : (lambda value : value >= 0, "a value of 0 or more"),
+    "MODEL_CONFIDENCE" : (lambda value : 0 <= value <= 1, "a value beetween 0 and 1"),
+    "ADAPT_MARGIN" : (lambda value : 0 <= value < 1, "a value of 0 or more, under 1"),
+    "GATE_WEIGHT" : (lambda value : 0 <= value <= 1, "a value beetween 0 and 1"),
+    "GATE_IOU" : (lambda value : 0 <= value <= 1, "a value beetween 0 and 1"),
+    "GATE_LOW_CONFIDENCE" : (lambda value : 0 <= value <= 1, "a value beetween 0 and 1"),
+    "TRESH_PERCENTAGE" : (lambda value : 0 < value <= 100, "a percentage above 0"),
+    "PORT" : (lambda value : 0 < value < 65536, "a port beetween 1 and 65535"),
+    "METRICS_PORT" : (lambda value : 0 <= value < 65536, "a port beetween 1 and 65535, or 0"),
+    "MANUAL_CALIBRATION_X" : (_is_calibration, "two points [[x, y], [x, y]]"),
+    "MANUAL_CALIBRATION_Y" : (_is_calibration, "two points [[x, y], [x, y]]"),
+    "ADAPTIVE_SIZES" : (lambda value : all(isinstance(size, int) and not isinstance(size, bool) and size > 0 for size in value),
+                        "a list of sizes above 0"),
+    "CAMERA_ZONES" : (lambda value : all(isinstance(zone, list) and len(zone) == 2 and all(map(_is_number, zone)) for zone in value),
+                      "a list of [start, end]"),
+    "CAMERA_CALIBRATIONS" : (lambda value : all(isinstance(calibration, list) and len(calibration) == 2
+                                                and all(map(_is_calibration, calibration)) for calibration in value),
+                             "a list of [MANUAL_CALIBRATION_X, MANUAL_CALIBRATION_Y]")
+}
+
+
+####################################################################################################
+#Config : Class containing the value of every constant : the defaults, updated by a JSON configuration file
+#         and by the command line. The file is watched and a new version is applied between two frames.
+#Parameters :
+#   String path : The JSON configuration file, None to use only the defaults and the command line.
+#   list overrides : The values given on the command line, "NAME=VALUE" (VALUE in JSON, or a string).
+#   float check_delay : The delay in seconds beetween two checks of the file.
+#Attributes :
+#   self.values : The current values, {name : value}. Replaced and never modified, a reference to it is a
+#                 coherent version of the configuration.
+#Methods :
+#   apply() :
+#       Use the last version of the file, if it changed since the last call. Return the names of the changed values.
+#   add_check(function) :
+#       Check the values together, now and on each new version of the file.
+#       function : Called with the values, raise a ValueError if they can't be used.
+#   close() :
+#       Stop watching the file.
+####################################################################################################
+class Config(threading.Thread) :
+    def __init__(self, path = None, overrides = (), check_delay = 1) :
+        super().__init__(name="config", daemon=True)
+        self.path = path
+        self.check_delay = check_delay
+        self.overrides = {}
+        for override in overrides :
+            name, _, value = override.partition("=")
+            try :
+                value = json.loads(value)
+            except ValueError :
+                pass
+            self.overrides[name] = value
+        self._checks = []
+        #An invalid configuration stop the start, but not a reload
+        self._mtime = self._get_mtime()
+        self.values = self._load()
+        self._pending = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        if path is not None :
+            self.start()
+
+    def apply(self) :
+        #Read without the lock, nothing to do on most of the frames
+        if self._pending is None :
+            return set()
+        with self._lock :
+            values, self._pending = self._pending, None
+        changed = {name for name, value in values.items() if value != self.values[name]}
+        ignored = changed & RESTART_KEYS
+        if ignored :
+            logger.warning('Need a restart to change : %s', ", ".join(sorted(ignored)))
+            values = {name : self.values[name] if name in ignored else value for name, value in values.items()}
+        self.values = values
+        changed -= ignored
+        if changed :
+            logger.info('Configuration changed : %s', ", ".join(f'{name}={values[name]!r}' for name in sorted(changed)))
+        return changed
+
+    #An invalid version of the file is then not applied, the current values are kept
+    def add_check(self, function) :
+        function(self.values)
+        self._checks.append(function)
+
+    def close(self) :
+        self._stop.set()
+
+    def run(self) :
+        while not self._stop.wait(self.check_delay) :
+            mtime = self._get_mtime()
+            if mtime == self._mtime :
+                continue
+            self._mtime = mtime
+            try :
+                values = self._load()
+            except (OSError, ValueError) as e :
+                logger.error('Configuration %s not applied : %s', self.path, e)
+                continue
+            with self._lock :
+                self._pending = values
+
+    def _get_mtime(self) :
+        try :
+            return os.stat(self.path).st_mtime_ns if self.path else None
+        except OSError :
+            return None
+
+    #Defaults, then the file, then the command line
+    def _load(self) :
+        values = dict(DEFAULTS)
+        if self.path is not None :
+            with open(self.path) as file :
+                loaded = json.load(file)
+            if not isinstance(loaded, dict) :
+                raise ValueError("The configuration need to be a JSON object")
+            values.update(loaded)
+        values.update(self.overrides)
+        for name, value in values.items() :
+            check(name, value)
+        for function in self._checks :
+            function(values)
+        return values
+
+
+#Raise a ValueError if name is not a constant, if value has not the type of its default, or if it's not one of
+#its CHOICES or outside its LIMITS
+def check(name, value) :
+    if name not in DEFAULTS :
+        raise ValueError(f'Unknown constant : {name}')
+    default = DEFAULTS[name]
+    #The paths disabled by default
+    if default is None :
+        return
+    if isinstance(default, bool) :
+        valid = isinstance(value, bool)
+    elif isinstance(default, (int, float)) :
+        #An int is accepted for a float, not the reverse
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool) and (isinstance(default, float) or isinstance(value, int))
+    else :
+        valid = isinstance(value, type(default))
+    if not valid :
+        raise ValueError(f'{name} need a {type(default).__name__}, got {value!r}')
+    if name in CHOICES and value not in CHOICES[name] :
+        raise ValueError(f'{name} need one of {", ".join(CHOICES[name])}, got {value!r}')
+    if name in LIMITS :
+        function, description = LIMITS[name]
+        if not function(value) :
+            raise ValueError(f'{name} need {description}, got {value!r}')
+
+
+#Parse the configuration arguments of the command line, the others are left to IO
+def parse_args(args) :
+    parser = argparse.ArgumentParser(description="", add_help=False)
+    parser.add_argument("-c", type=str, default=None, dest="config_file", help="JSON configuration file, watched while running")
+    parser.add_argument("--set", type=str, default=[], action="append", dest="overrides", metavar="NAME=VALUE",
+                        help="Change a constant, can be repeated")
+    parser.add_argument("--print-config", action="store_true", help="Print the configuration in JSON and exit")
+    return parser.parse_known_args(args)[0]
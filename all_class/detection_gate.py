@@ -0,0 +1,104 @@
+import numpy as np
+
+from all_class.model import Model_Detections, to_numpy
+
+
+#What to do with the detections outside the zone
+DROP = "drop"
+WEIGHT = "weight"
+
+
+####################################################################################################
+#Detection_Gate : Class filtering the detections of the model before the tracker, so the cost of the matching
+#                 of Norfair (detections x tracks) depends on the people in the installation, not on the
+#                 passers-by around it.
+#Parameters :
+#   int margin : The margin in px around the calibrated zone, the detections outside are gated.
+#   String mode : "drop" to remove the detections outside the zone, "weight" to multiply their confidence by weight.
+#   float weight : The factor of the confidence of the detections outside the zone in "weight" mode.
+#   float iou : The IoU above which a low confidence box is removed by a more confident box overlapping it.
+#   float low_confidence : The confidence under which a box can be removed by the overlap.
+#Attributes :
+#   self.seen : The number of detections received.
+#   self.dropped_zone : The number of detections removed outside the zone.
+#   self.weighted : The number of detections outside the zone with a lowered confidence.
+#   self.dropped_overlap : The number of low confidence boxes removed by the overlap.
+#   self.avoided_pairs : The number of (detection, track) pairs not computed by the tracker.
+#Methods :
+#   configure(margin, mode, weight, iou, low_confidence) :
+#       Change the parameters while running.
+#   filter(yolo_detections, calibration_x, calibration_y, nbr_tracks) :
+#       Return the detections (Model_Detections) kept for the tracker.
+#       calibration_x, calibration_y : The formated calibration, [left, right] and [top, down] (IO.get_formated_calibration_x/y()).
+#       nbr_tracks : The number of tracks of the tracker, to count the pairs avoided.
+####################################################################################################
+class Detection_Gate :
+    def __init__(self, margin = 50, mode = DROP, weight = 0.5, iou = 0.7, low_confidence = 0.3) :
+        self.configure(margin, mode, weight, iou, low_confidence)
+        self.seen = 0
+        self.dropped_zone = 0
+        self.weighted = 0
+        self.dropped_overlap = 0
+        self.avoided_pairs = 0
+
+    def configure(self, margin = 50, mode = DROP, weight = 0.5, iou = 0.7, low_confidence = 0.3) :
+        if mode not in (DROP, WEIGHT) :
+            raise ValueError(f'Unknown gate mode : {mode}')
+        self.margin = margin
+        self.mode = mode
+        self.weight = weight
+        self.iou = iou
+        self.low_confidence = low_confidence
+
+    def filter(self, yolo_detections, calibration_x, calibration_y, nbr_tracks = 0) :
+        #Rows [x1, y1, x2, y2, confidence, class], copied as the confidence can change
+        detections = np.array(to_numpy(yolo_detections.xyxy[0]))
+        received = len(detections)
+        self.seen += received
+        if received == 0 :
+            return yolo_detections
+        outside = self._outside(detections, calibration_x, calibration_y)
+        if self.mode == DROP :
+            detections = detections[~outside]
+            self.dropped_zone += int(outside.sum())
+        else :
+            detections[outside, 4] *= self.weight
+            self.weighted += int(outside.sum())
+        keep = self._overlap(detections)
+        self.dropped_overlap += int((~keep).sum())
+        detections = detections[keep]
+        self.avoided_pairs += (received - len(detections)) * nbr_tracks
+        return Model_Detections(detections)
+
+    #Detections outside the zone plus the margin, with the same points as Detection_Process.get_final_objects()
+    def _outside(self, detections, calibration_x, calibration_y) :
+        left, right = calibration_x
+        top, down = calibration_y
+        outside = np.zeros(len(detections), dtype=bool)
+        #Not calibrated yet
+        if right <= left :
+            return outside
+        centers_x = (detections[:, 0] + detections[:, 2]) / 2
+        outside |= (centers_x < left - self.margin) | (centers_x > right + self.margin)
+        if down != 0 or top != 0 :
+            #The feet, and the point at 3/4 of the height
+            feet = detections[:, 3]
+            outside |= (feet > down + self.margin) | (feet - (detections[:, 3] - detections[:, 1]) / 4 < top - self.margin)
+        return outside
+
+    #Remove the low confidence boxes overlapping a more confident box, all the IoU at once
+    def _overlap(self, detections) :
+        keep = np.ones(len(detections), dtype=bool)
+        low = np.flatnonzero(detections[:, 4] < self.low_confidence)
+        if len(low) == 0 or len(detections) < 2 :
+            return keep
+        boxes = detections[:, :4]
+        low_boxes = boxes[low]
+        width = np.minimum(low_boxes[:, None, 2], boxes[None, :, 2]) - np.maximum(low_boxes[:, None, 0], boxes[None, :, 0])
+        height = np.minimum(low_boxes[:, None, 3], boxes[None, :, 3]) - np.maximum(low_boxes[:, None, 1], boxes[None, :, 1])
+        intersections = np.clip(width, 0, None) * np.clip(height, 0, None)
+        areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+        iou = intersections / np.maximum(areas[low, None] + areas[None, :] - intersections, 1e-9)
+        stronger = detections[None, :, 4] > detections[low, 4][:, None]
+        keep[low[((iou > self.iou) & stronger).any(axis=1)]] = False
+        return keep
@@ -14,6 +14,7 @@ import numpy as np
 #   calibration : The (right limit, left limit) defined by the calibration.
 #Attribute :
 #   self.informations : Informations of the object.
+#   self._scores : The score of each track of the last frame, with the past detections it was computed from.
 #   self.final_frame : The final drawn frame.
 
 class Detection_Process:
@@ -25,6 +26,8 @@ class Detection_Process:
         #Store Dimensions of the screen
         self.screen_width = screen_width
         self.screen_height = screen_height
+        #Score of each track of the last frame
+        self._scores = {}
     
     #Convert the pixel center's position into percentage relative to the calibration
     def convertCenter(self, center) :
@@ -43,50 +46,59 @@ class Detection_Process:
         self.top_limit = calibration_y[0]
         self.down_limit = calibration_y[1]
 
-        for object in all_object : 
-            detected = True
-            #Reject detection if one of the points doesn't exists
-            live_counter = 0
-            for live in object.live_points:
-                if not live:
-                    live_counter += 1
+        #Reject detection if one of the points doesn't exists
+        objects = [object for object in all_object if object.live_points.all()]
+        #Score of each track, computed again only when Norfair change its past detections
+        scores = {}
+        if objects :
+            #All the tracks at once
+            corners = np.array([object.estimate for object in objects]).reshape(-1, 4).astype(np.int64)
+            tl, br = corners[:, 0:2], corners[:, 2:4]
+            centers = tl + np.abs((br - tl) / 2)
+            ids = [-1 if object.global_id == None else object.global_id for object in objects]
+            ages = np.array([object.age for object in objects], dtype=np.int64)
+            #Norfair Confidence
+            score = np.array([self._get_score(object, scores) for object in objects])
+            #Call to Moving
+            moves = moving.get_movings(ids, ages, centers)
+            #Position in % relative to the calibration, the limits are 0 before the first calibration
+            with np.errstate(divide="ignore", invalid="ignore") :
+                positions = (centers[:, 0] - self.left_limit) / ((self.right_limit - self.left_limit) / 100)
+            valid = (ages >= min_age) & (score >= min_score)
+            #Calibration Gestion
+            #Offset is 25% of the height
+            offsets = (br[:, 1] - centers[:, 1]) / 2
+            #Out on Y axis
+            out = ((br[:, 1] > self.down_limit) | (br[:, 1] - offsets < self.top_limit)) & (self.down_limit != 0 or self.top_limit != 0)
+            #Out on X axis
+            out |= (centers[:, 0] < self.left_limit) | (centers[:, 0] > self.right_limit)
+            tl, br, centers, moves, positions, out = tl.tolist(), br.tolist(), centers.tolist(), moves.tolist(), positions.tolist(), out.tolist()
+            for i in np.flatnonzero(valid).tolist() :
+                if out[i] :
+                    self.draw_info.append([out_id, tuple(tl[i]), tuple(br[i]), tuple(centers[i])])
+                else :
+                    self.informations.append([ids[i], 1, moves[i], positions[i]])
+                    self.draw_info.append([ids[i], tuple(tl[i]), tuple(br[i]), tuple(centers[i])])
+        self._scores = scores
 
-            if live_counter > 0:
-                    detected = False
+        #Forget the moves of the objects not tracked anymore
+        moving.clean([-1 if object.global_id == None else object.global_id for object in all_object])
 
-            if detected:
-                tl = (int(object.estimate[0][0]), int(object.estimate[0][1]))
-                br = (int(object.estimate[1][0]), int(object.estimate[1][1]))
-                id = object.global_id
-                if id == None:
-                    id = -1
-                #Norfair Confidence
-                tmp_score = []
-                for detection in object.past_detections:
-                    tmp_score.append(np.median(detection.scores))
-                score = np.median(tmp_score)
-                center = tl[0] + abs((br[0] - tl[0])/2), tl[1] + abs((br[1] - tl[1])/2)
+        #New lists on every frame, they can be kept by the caller
+        return self.informations
 
-                #Call to Moving
-                move = moving.get_moving(id, object.age, center)
-                pos = self.convertCenter(center)
-                
-                if object.age >= min_age and score >= min_score :
-                    #Calibration Gestion
-                    #Offset is 25% of the height
-                    offset = (br[1] - center[1]) / 2
-                    if (br[1] > self.down_limit or br[1] - offset < self.top_limit) and (self.down_limit != 0 or self.top_limit != 0):
-                        #Out on Y axis
-                        self.draw_info.append([out_id, tl, br, center])
-                    elif (center[0] < self.left_limit or center[0] > self.right_limit):
-                        #Out on X axis
-                        self.draw_info.append([out_id, tl, br, center])
-                    else :
-                        self.informations.append([id, 1, move, pos])
-                        self.draw_info.append([id, tl, br, center])
-                    
-        to_send = []
-        for id, in_, move, pos in self.informations:
-            to_send.append([id, in_, move, pos])
-        
-        return to_send
\ No newline at end of file
+    #Median of the median scores of the past detections of a track. Norfair only append to the past detections
+    #(dropping the oldest one), the score is kept while the last one is the same.
+    def _get_score(self, object, scores) :
+        past = object.past_detections
+        last = past[-1] if len(past) > 0 else None
+        cached = self._scores.get(id(object))
+        if cached is not None and cached[1] is last and cached[2] == len(past) :
+            score = cached[3]
+        elif len(past) == 0 :
+            score = float("nan")
+        else :
+            score = float(np.median(np.median(np.array([detection.scores for detection in past]), axis=1)))
+        #The object is kept with its score, so its id can't be reused by another one
+        scores[id(object)] = (object, last, len(past), score)
+        return score
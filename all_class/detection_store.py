@@ -0,0 +1,101 @@
+import os
+import numpy as np
+
+from all_class.model import Model_Detections, to_numpy
+
+
+#Files of a store
+DETECTIONS_FILE = "detections.f32"
+INDEX_FILE = "index.i64"
+
+
+####################################################################################################
+#Detection store : Directory containing the detections of the model for each frame of a video, to re-run the
+#                  tracking and everything after it without the model.
+#   detections.f32 : All the detections, one row [x1, y1, x2, y2, confidence, class] of float32 per box.
+#   index.i64 : One row [frame sequence, end row in detections.f32] of int64 per frame with detections.
+#Both files are written from the start by a recording, only appended, and read with a memory map.
+####################################################################################################
+
+
+####################################################################################################
+#Detection_Recorder : Append the detections of each frame to a store.
+#Parameters :
+#   String path : The directory of the store, created if needed. An existing store is replaced, its index
+#                 would no longer be sorted by the sequences of a new video.
+#Attributes :
+#   self.rows : The number of detections in the store.
+#   self.frames : The number of frames in the store.
+#Methods :
+#   append(sequence, yolo_detections) :
+#       Add the detections of a frame.
+#       sequence : The sequence number of the frame in the video (IO.frame_sequence).
+#       yolo_detections : The detections of the model.
+#   close() :
+#       Write the detections still in the buffers and close the files.
+####################################################################################################
+class Detection_Recorder :
+    def __init__(self, path) :
+        os.makedirs(path, exist_ok=True)
+        self._detections = open(os.path.join(path, DETECTIONS_FILE), "wb")
+        self._index = open(os.path.join(path, INDEX_FILE), "wb")
+        self.rows = 0
+        self.frames = 0
+
+    def append(self, sequence, yolo_detections) :
+        detections = to_numpy(yolo_detections.xyxy[0]).astype(np.float32)
+        self._detections.write(detections.tobytes())
+        self.rows += len(detections)
+        self._index.write(np.array([sequence, self.rows], dtype=np.int64).tobytes())
+        self.frames += 1
+
+    def close(self) :
+        self._detections.close()
+        self._index.close()
+
+
+####################################################################################################
+#Detection_Replay : Read the detections of a store, without loading it in memory.
+#Parameters :
+#   String path : The directory of the store.
+#Attributes :
+#   self.sequences : The sequence number of each frame of the store, in order.
+#Methods :
+#   getDetections(sequence) :
+#       Return the detections (Model_Detections) of the frame sequence, None if the model didn't run on it.
+#   frames() :
+#       Iterate over the frames of the store, (sequence, Model_Detections).
+####################################################################################################
+class Detection_Replay :
+    def __init__(self, path) :
+        self.detections = _memmap(os.path.join(path, DETECTIONS_FILE), np.float32, 6)
+        index = _memmap(os.path.join(path, INDEX_FILE), np.int64, 2)
+        #After a crash, the last frames can point after the last detections written
+        index = index[:np.searchsorted(index[:, 1], len(self.detections), side="right")]
+        self.sequences = index[:, 0]
+        self.ends = index[:, 1]
+
+    def __len__(self) :
+        return len(self.sequences)
+
+    def getDetections(self, sequence) :
+        position = np.searchsorted(self.sequences, sequence)
+        if position == len(self.sequences) or self.sequences[position] != sequence :
+            return None
+        return self._get(position)
+
+    def frames(self) :
+        for position, sequence in enumerate(self.sequences) :
+            yield int(sequence), self._get(position)
+
+    def _get(self, position) :
+        start = self.ends[position - 1] if position > 0 else 0
+        return Model_Detections(self.detections[start:self.ends[position]])
+
+
+#Memory map of the complete rows of columns values of a file, an empty array if there's none (not mappable)
+def _memmap(path, dtype, columns) :
+    rows = os.path.getsize(path) // (np.dtype(dtype).itemsize * columns)
+    if rows == 0 :
+        return np.empty((0, columns), dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(rows, columns))
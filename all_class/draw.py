@@ -1,8 +1,32 @@
 import cv2
+import numpy as np
 
 
+####################################################################################################
+#Draw : Class drawing the detections, the slots and the calibration on the frame.
+#Parameters :
+#   int draw_every : Draw (and display) only one frame every draw_every frames.
+#Attributes :
+#   self.frame_count : The number of frames received.
+#   self.static_calibration : The calibration of the static layer.
+#   self.static_index : The flat index of the pixels of the static layer.
+#   self.static_pixels : The color of the pixels of the static layer.
+#Methods :
+#   should_draw() :
+#       Return True if the current frame must be drawn and displayed.
+#   draw_info(frame, detection_info, client_info, calibration_x, calibration_y, out_id, raw, objects, debug) :
+#       Draw all the informations on the frame and return it.
+####################################################################################################
 class Draw:
-    def __init__(self) :
+    def __init__(self, draw_every = 1) :
+        self.draw_every = max(draw_every, 1)
+        self.frame_count = 0
+        #Static layer of the calibration, drawn once per calibration
+        self.static_calibration = None
+        self.static_shape = None
+        self.static_index = None
+        self.static_pixels = None
+
         #Position
         self.x_start = 20
         self.y_start = 50 
@@ -14,24 +38,50 @@ class Draw:
         #Space between each line
         self.line_spacing = 20
         
+    def should_draw(self) :
+        draw = self.frame_count % self.draw_every == 0
+        self.frame_count += 1
+        return draw
+
+    #Draw the calibration circles and rectangle on image
+    def draw_calibration(self, image, calibration_x, calibration_y, color) :
+        leftMost = tuple(calibration_x[0])
+        rightMost = tuple(calibration_x[1])
+        topMost = tuple(calibration_y[0])
+        bottomMost = tuple(calibration_y[1])
+
+        calibration_topLeft = (leftMost[0], topMost[1])
+        calibration_bottomRight = (rightMost[0], bottomMost[1])
+
+        cv2.circle(image, leftMost, radius=10, color=color, thickness=cv2.FILLED)
+        cv2.circle(image, rightMost, radius=10, color=color, thickness=cv2.FILLED)
+        cv2.circle(image, topMost, radius=10, color=color, thickness=cv2.FILLED)
+        cv2.circle(image, bottomMost, radius=10, color=color, thickness=cv2.FILLED)
+        cv2.rectangle(image, calibration_topLeft, calibration_bottomRight, color, self.font_thickness)
+
+    #Copy the calibration layer on the frame, the layer is drawn again only when the calibration changes
+    def draw_static(self, frame, calibration_x, calibration_y) :
+        calibration = (tuple(calibration_x[0]), tuple(calibration_x[1]), tuple(calibration_y[0]), tuple(calibration_y[1]))
+        if calibration != self.static_calibration or frame.shape != self.static_shape :
+            mask = np.zeros(frame.shape[:2], dtype=np.uint8)
+            self.draw_calibration(mask, calibration_x, calibration_y, 255)
+            self.static_index = np.flatnonzero(mask)
+            self.static_pixels = np.empty((len(self.static_index), 3), dtype=frame.dtype)
+            self.static_pixels[:] = (255, 0, 0)
+            self.static_calibration = calibration
+            self.static_shape = frame.shape
+        if frame.flags.c_contiguous :
+            #View of the frame, one pixel per row
+            frame.reshape(-1, 3)[self.static_index] = self.static_pixels
+        else :
+            self.draw_calibration(frame, calibration_x, calibration_y, (255, 0, 0))
+
     #detection_info : [id, tl, br, center] only for tracked person
     #client_info : [id, inside/outside, moving, position in %] for all slots
     def draw_info(self, frame, detection_info, client_info, calibration_x, calibration_y, out_id, raw, objects, debug = False) :
         
         #Drawing calibration rectangle
-        leftMost = calibration_x[0]
-        rightMost = calibration_x[1]
-        topMost = calibration_y[0]
-        bottomMost = calibration_y[1]
-
-        calibration_topLeft = [leftMost[0], topMost[1]]
-        calibration_bottomRight = [rightMost[0], bottomMost[1]]
-
-        cv2.circle(frame, leftMost, radius=10, color=(255, 0, 0), thickness=cv2.FILLED)
-        cv2.circle(frame, rightMost, radius=10, color=(255, 0, 0), thickness=cv2.FILLED)
-        cv2.circle(frame, topMost, radius=10, color=(255, 0, 0), thickness=cv2.FILLED)
-        cv2.circle(frame, bottomMost, radius=10, color=(255, 0, 0), thickness=cv2.FILLED)
-        cv2.rectangle(frame, calibration_topLeft, calibration_bottomRight, (255, 0, 0), self.font_thickness)
+        self.draw_static(frame, calibration_x, calibration_y)
         y = self.y_start
         #print("\nDRAW*******************************\n")
         #print(f'DETECTION INFO : {detection_info}')
@@ -63,19 +113,21 @@ class Draw:
                     cv2.rectangle(frame, detect_person[1], detect_person[2], (255, 0, 0), self.font_thickness)
                     cv2.putText(frame, str(person_id), (int(detect_person[3][0]), int(detect_person[3][1])), self.font, 1, (255, 255, 255), self.font_thickness)
         #Drawing info
+        #Detection of each id, to find the detection of a slot directly
+        detection_of = {detect_person[0] : detect_person for detect_person in detection_info}
         for i in range(len(client_info)) :
             person = client_info[i]
             id_client = person[0]
             moving = person[2]
-            for detect_person in detection_info:
-                if detect_person[0] == id_client :
-                    if moving :
-                        # Moving
-                        cv2.rectangle(frame, detect_person[1], detect_person[2], (0, 0, 255), self.font_thickness)
-                    else :
-                        # Not moving
-                        cv2.rectangle(frame, detect_person[1], detect_person[2], (0, 255, 0), self.font_thickness)
-                    cv2.putText(frame, str(id_client), (int(detect_person[3][0]), int(detect_person[3][1])), self.font, 2, (255, 255, 255), self.font_thickness)
+            detect_person = detection_of.get(id_client)
+            if detect_person is not None :
+                if moving :
+                    # Moving
+                    cv2.rectangle(frame, detect_person[1], detect_person[2], (0, 0, 255), self.font_thickness)
+                else :
+                    # Not moving
+                    cv2.rectangle(frame, detect_person[1], detect_person[2], (0, 255, 0), self.font_thickness)
+                cv2.putText(frame, str(id_client), (int(detect_person[3][0]), int(detect_person[3][1])), self.font, 2, (255, 255, 255), self.font_thickness)
 
             text = "Slot "+str(i)+" : Inside : "+str(person[1])+", Moving : "+str(person[2])+", Position : "+str(person[3])+"."
             cv2.putText(frame, text, (self.x_start, y), self.font, self.font_scale, (255, 255, 255), self.font_thickness)
@@ -0,0 +1,274 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+import numpy as np
+
+from all_class.model import Model, Model_Detections, to_numpy
+
+
+#Frames in the shared memory for each worker, one processed while the next one is written
+SLOTS_PER_WORKER = 2
+#Time in seconds between two checks of the workers while waiting for them
+WORKER_CHECK = 1
+#Time in seconds given to each worker to stop before it is terminated
+STOP_TIMEOUT = 10
+
+
+####################################################################################################
+#Inference_Pool : Class running the model in several processes, each with its own copy of the model, so the
+#                 inference use all the cores without the GIL of the main process. The frames are written in
+#                 a ring of slots in shared memory (only the slot number is sent to the workers), and the
+#                 detections are given back in the order of the frames. The slots are made for the first frame
+#                 (the size of the camera), and made again, once they are all free, for a bigger one.
+#                 If a worker dies, the pool stops : the pending Futures fail and the next submits raise.
+#Parameters :
+#   tuple model_arguments : The arguments of Model() in each worker.
+#   int nbr_workers : The number of worker processes.
+#Attributes :
+#   self.frame_shape : The shape (height, width, 3) of the slots, None before the first frame.
+#   self.model : The pool itself, the same attribute as Batch_Model.
+#   self.futures : The Future of each frame not given back yet, {sequence : Future}.
+#   self.frame_count : The number of frames processed.
+#   self.latency : The inference time in seconds of the last frame shared by the workers, None before the first one.
+#   self.batch_count : The number of frames detected, the same attribute as Batch_Model (one frame per pass).
+#   self.replacement : The pool receiving the frames submitted after close(), None if there's none.
+#   self.error : The reason the pool stopped (a worker died), None while it works.
+#Methods :
+#   submit(frame, scale) :
+#       Write a frame in a free slot (wait for one if they are all used) and return a Future of its detections
+#       (see Model.getDetections()). The Futures are completed in the order of the submits.
+#   getDetections(frame, scale) :
+#       Same as Model.getDetections(frame, scale).
+#   getBatchDetections(frames, scales) :
+#       Same as Model.getBatchDetections(frames, scales), the frames are spread over the workers.
+#   close(replacement) :
+#       Process the frames already submitted, then stop the workers and free the shared memory.
+#       replacement : The pool (a new model) used by the submits made during or after the close.
+####################################################################################################
+class Inference_Pool :
+    def __init__(self, model_arguments, nbr_workers) :
+        self.model = self
+        self.frame_shape = None
+        self.futures = {}
+        self.frame_count = 0
+        self.latency = None
+        self.batch_count = 0
+        self.replacement = None
+        self.error = None
+        self._closed = False
+        self._memory = None
+        self._frames = None
+        self._nbr_slots = nbr_workers * SLOTS_PER_WORKER
+        self._free = queue.Queue()
+        for slot in range(self._nbr_slots) :
+            self._free.put(slot)
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._next = 0
+        #Results arrived before the ones of the previous frames
+        self._done = {}
+        #Spawn : the workers don't inherit the threads and the model of this process
+        context = multiprocessing.get_context("spawn")
+        self._tasks = context.Queue()
+        self._results = context.Queue()
+        self._workers = [context.Process(target=_worker, name=f'inference_{worker}', daemon=True,
+                                         args=(model_arguments, self._tasks, self._results))
+                         for worker in range(nbr_workers)]
+        for worker in self._workers :
+            worker.start()
+        #Wait for the model of every worker, an error or a dead worker stop the start
+        started = 0
+        while started < len(self._workers) :
+            try :
+                error = self._results.get(timeout=WORKER_CHECK)
+            except queue.Empty :
+                if all(worker.is_alive() for worker in self._workers) :
+                    continue
+                error = "worker stopped while loading the model"
+            if error is not None :
+                self._stop_workers()
+                raise RuntimeError(f'Inference worker not started : {error}')
+            started += 1
+        self._thread = threading.Thread(target=self._collect, name="inference_pool", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame, scale = None) :
+        height, width = frame.shape[:2]
+        #Locked until the task is sent, so a close can't stop the workers beetween the two
+        with self._lock :
+            if self._closed :
+                if self.replacement is None :
+                    raise RuntimeError("Inference pool closed")
+                return self.replacement.submit(frame, scale)
+            self._reserve(height, width)
+            slot = self._get_slot()
+            self._frames[slot, :height, :width] = frame
+            future = Future()
+            sequence = self._sequence
+            self._sequence += 1
+            self.futures[sequence] = future
+            self._tasks.put((sequence, self._memory.name, self.frame_shape, slot, height, width, scale))
+        return future
+
+    def getDetections(self, frame, scale = None) :
+        return self.submit(frame, scale).result()
+
+    def getBatchDetections(self, frames, scales = None) :
+        if scales is None :
+            scales = [None] * len(frames)
+        futures = [self.submit(frame, scale) for frame, scale in zip(frames, scales)]
+        return [future.result() for future in futures]
+
+    #Wait for a free slot, as long as the workers are running
+    def _get_slot(self) :
+        while True :
+            if self.error is not None :
+                raise RuntimeError(f'Inference pool stopped : {self.error}')
+            try :
+                return self._free.get(timeout=WORKER_CHECK)
+            except queue.Empty :
+                pass
+
+    #Make the slots for a frame bigger than them, once the workers are done with the current ones
+    def _reserve(self, height, width) :
+        if self.frame_shape is not None and height <= self.frame_shape[0] and width <= self.frame_shape[1] :
+            return
+        slots = []
+        try :
+            while len(slots) < self._nbr_slots :
+                slots.append(self._get_slot())
+        except RuntimeError :
+            for slot in slots :
+                self._free.put(slot)
+            raise
+        if self.frame_shape is not None :
+            height, width = max(height, self.frame_shape[0]), max(width, self.frame_shape[1])
+        self._free_memory()
+        self.frame_shape = (height, width, 3)
+        self._memory = shared_memory.SharedMemory(create=True, size=self._nbr_slots * height * width * 3)
+        self._frames = np.ndarray((self._nbr_slots,) + self.frame_shape, dtype=np.uint8, buffer=self._memory.buf)
+        for slot in slots :
+            self._free.put(slot)
+
+    #The workers keep their own mapping until their next task, the name is only removed
+    def _free_memory(self) :
+        if self._memory is None :
+            return
+        self._frames = None
+        self._memory.close()
+        self._memory.unlink()
+        self._memory = None
+
+    def close(self, replacement = None) :
+        with self._lock :
+            self.replacement = replacement
+            self._closed = True
+        self._stop_workers()
+        self._results.put(None)
+        self._thread.join()
+        self._free_memory()
+
+    #The tasks are taken in order, the stop of each worker come after the frames already submitted
+    def _stop_workers(self) :
+        for _ in self._workers :
+            self._tasks.put(None)
+        for worker in self._workers :
+            worker.join(STOP_TIMEOUT)
+            if worker.is_alive() :
+                worker.terminate()
+                worker.join()
+
+    #Complete the Futures in the order of the frames
+    def _collect(self) :
+        while True :
+            try :
+                message = self._results.get(timeout=WORKER_CHECK)
+            except queue.Empty :
+                #The workers stop on their own after a close
+                if self._closed or all(worker.is_alive() for worker in self._workers) :
+                    continue
+                self._fail("an inference worker died")
+                return
+            if message is None :
+                break
+            sequence, slot, detections, error, duration = message
+            self._free.put(slot)
+            self._done[sequence] = (detections, error, duration)
+            while self._next in self._done :
+                detections, error, duration = self._done.pop(self._next)
+                future = self.futures.pop(self._next)
+                self._next += 1
+                self.frame_count += 1
+                if error is not None :
+                    future.set_exception(RuntimeError(error))
+                else :
+                    #The workers run side by side, each frame takes a share of the time
+                    self.latency = duration / len(self._workers)
+                    self.batch_count += 1
+                    future.set_result(Model_Detections(detections))
+
+    #Stop the pool : the next submits raise and the frames not given back fail
+    def _fail(self, error) :
+        self.error = error
+        #Taken once the submit waiting for a slot has seen the error
+        with self._lock :
+            futures = list(self.futures.values())
+            self.futures.clear()
+        for future in futures :
+            future.set_exception(RuntimeError(f'Inference pool stopped : {error}'))
+
+
+#Process of an Inference_Pool : load the model, then run it on the slots given by the tasks until None
+def _worker(model_arguments, tasks, results) :
+    try :
+        model = Model(*model_arguments)
+    except Exception as e :
+        results.put(repr(e))
+        return
+    results.put(None)
+    #The shared memory of the slots, opened again when the pool makes new slots
+    memory, frame = None, None
+    while True :
+        task = tasks.get()
+        if task is None :
+            break
+        sequence, memory_name, frame_shape, slot, height, width, scale = task
+        try :
+            if memory is None or memory.name != memory_name :
+                if memory is not None :
+                    frame = None
+                    memory.close()
+                memory = _attach(memory_name)
+            #A view of the slot, without copy
+            frame = np.ndarray(frame_shape, dtype=np.uint8, buffer=memory.buf, offset=slot * int(np.prod(frame_shape)))
+            start = time.perf_counter()
+            detections = model.getDetections(frame[:height, :width], scale)
+            results.put((sequence, slot, to_numpy(detections.xyxy[0]).astype(np.float32), None, time.perf_counter() - start))
+        except Exception as e :
+            results.put((sequence, slot, None, repr(e), 0))
+    frame = None
+    if memory is not None :
+        memory.close()
+
+
+#Open the shared memory of the pool, without letting the worker unlink it when it stops
+def _attach(memory_name) :
+    try :
+        return shared_memory.SharedMemory(name=memory_name, track=False)
+    #Before Python 3.13
+    except TypeError :
+        from multiprocessing import resource_tracker
+        memory = shared_memory.SharedMemory(name=memory_name)
+        resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
+
+
+#The threads of the model in each worker, to share the cores beetween the workers
+def worker_threads(threads, nbr_workers) :
+    if threads > 0 :
+        return threads
+    return max((os.cpu_count() or 1) // nbr_workers, 1)
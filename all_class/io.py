@@ -1,37 +1,60 @@
 import argparse
 from datetime import datetime
+import logging
 import threading
 import time
 import cv2
 import numpy as np
 
+from all_class.video_writer import Video_Writer
+
+
+logger = logging.getLogger(__name__)
 
 ####################################################################################################
 #IO : Class controlling input and output
 #Parameters :
 #   args : The arguments to parse
+#   screen_width, screen_height : The size of the screen, the coordinates of the detections, of the calibration,
+#                                 of the drawing and of the local output. The frames keep the size of the camera.
+#   writer_queue : The maximum number of frames waiting to be encoded in the local output.
+#   writer_policy : What to do when the local output is late, "block" or "drop".
+#   segment_minutes : The duration in minutes of each file of the local output, 0 for one file.
+#   frame_buffers : For a live input, the number of frame buffers. A frame of get_Frame() is only reused after
+#                   free_frame(), the capture skips the frames while all the buffers are held.
 #Attribute :
 #   self.input_name : The name of the input.
 #   self.output_name : The name of the output.
 #   self.live : Indicate if the input is live.
 #   self.cap : The video flow.
-#   self.video_size : The size of the video.
-#   self._local_output : The local output.
+#   self.video_size : The size of the screen.
+#   self._local_output : The local output (Video_Writer), None without output file.
 #   self._calibrate : Indicate if the camera is calibrated.
+#   self.frame_timestamp : The capture timestamp (time.time()) of the last frame of get_Frame().
+#   self.frame_sequence : The sequence number of the last frame of get_Frame().
+#   self.reconnections : The number of reconnections of the input.
+#   self.window_name : The name of the window of the live output.
 #Methods :
 #   __init__(args) : 
 #       Initiate the input and output objects.
 #       args : The arguments passed to the function.
 #   get_Frame() : 
-#       Get, resize and return the last frame, and launch reconnection() if there's no frame.
+#       Get and return the last frame, at the size of the camera, and launch reconnection() if there's no frame.
+#   get_scale(frame) :
+#       Return the factor (x, y) from the coordinates of a frame to the coordinates of the screen.
+#   screen_frame(frame, copy) :
+#       Return the frame resized to the screen, for the drawing and the outputs. The frame itself if it's already
+#       at this size, unless copy is True.
+#   free_frame(frame) :
+#       Give the buffer of a frame of get_Frame() back to the capture, once nothing uses it anymore.
 #   local_output(frame) :
 #       Generate a local output with the name passed in arguments.
-#       frame : The last frame.
+#       frame : The last frame, resized if it's not at the size of the screen.
 #   live_output(frame) :
 #       Generate a live output.
 #       frame : The last frame.
 #   close() :
-#       Close all input and output threads.
+#       Close all input and output threads, the frames waiting for the local output are written.
 #   reconnection() :
 #       Close the input and try to instantiate it again. Launched when get_Frame() get no frame.
 #   calibrate(frame, nbr_groupe, delay) :
@@ -41,14 +64,23 @@ import numpy as np
 #       nbr_groupe : The number of groups of pixels to keep.
 #       delay : The delay in minutes beetween each calibration.
 #       calibration_draw : Indicate if a visual output of the calibration is needed.
+#   find_limits(gray, nbr_groupe, tresh_percentage, debug_frame) :
+#       Return the extreme left/right/top/bottom pixels of the biggest groups of the most luminous pixels.
+#       gray : The frame in gray scale.
+#       debug_frame : If given, the calibration images are written in the background.
+#   set_calibration(leftMost, rightMost, topMost, bottomMost) :
+#       Publish the limits of a calibration, safe to call from another thread.
+#   get_calibration() :
+#       Return calibration_x and calibration_y of the same calibration.
 ####################################################################################################
 class IO :
-    def __init__(self, args, screen_width, screen_height) :
+    def __init__(self, args, screen_width, screen_height, writer_queue = 64, writer_policy = "block", segment_minutes = 0, frame_buffers = 3) :
         #Parse arguments
         parser = argparse.ArgumentParser(description="")
         parser.add_argument("-i", type=str, required=True, default=None, dest="input_file", help="Input file")
         parser.add_argument("-o", type=str, default=None, dest="output_file", help="Output file, need to finish with a .mp4")
-        list = parser.parse_args(args)
+        #The configuration arguments (-c, --set) are parsed by the Config
+        list = parser.parse_known_args(args)[0]
         self.input_name = list.input_file
         self.output_name = list.output_file
         if (self.output_name and self.output_name.endswith(".mp4") == False) :
@@ -65,7 +97,7 @@ class IO :
             self.cap = cv2.VideoCapture(self.input_name)
         #Verify if video flow is valid
         if (self.cap.isOpened() == False):
-            print("Error opening video stream or file")
+            logger.error("Error opening video stream or file")
             exit(-1)
         #Configure local output
         #Correct codec for mp4
@@ -73,11 +105,20 @@ class IO :
         video_fps = self.cap.get(cv2.CAP_PROP_FPS)
         
         self.video_size = (screen_width, screen_height)
-        self._local_output = cv2.VideoWriter(self.output_name, video_FourCC, video_fps, self.video_size)
+        #Encoded in the background
+        self._local_output = None
+        if self.output_name :
+            self._local_output = Video_Writer(self.output_name, video_FourCC, video_fps, self.video_size,
+                                              writer_queue, writer_policy, segment_minutes * 60)
 
-        #If live, convert cap to a custom one
+        #If live, convert cap to a custom one, decoding the frames itself
+        self.frame_buffers = frame_buffers
         if(self.input_name.startswith("rtsp://")):
-            self.cap = CaptureLiveFrameThread(self.cap)
+            self.cap = CaptureLiveFrameThread(self.cap, self.frame_buffers)
+        self.frame_timestamp = 0
+        self.frame_sequence = 0
+        self.reconnections = 0
+        self.window_name = 'Video with Detections'
         #Init calibrate
         self._calibrate = False
         #Init calibration timestamp
@@ -85,36 +126,63 @@ class IO :
         #Calibration pixels
         self.calibration_x = [[0, 0], [0, 0]]
         self.calibration_y = [[0, 0], [0, 0]]
+        #Lock to update calibration_x and calibration_y together from another thread
+        self.calibration_lock = threading.Lock()
 
     def get_Frame(self) :
         if self.cap.isOpened() :
+            if isinstance(self.cap, CaptureLiveFrameThread) :
+                ret, frame, self.frame_timestamp, self.frame_sequence = self.cap.read_info()
+                return ret, frame
+            #Not resized, the model resize it once for its input
             ret, frame = self.cap.read()
             if ret:
-                frame = cv2.resize(frame, self.video_size)
+                self.frame_timestamp = time.time()
+                self.frame_sequence += 1
             return ret, frame
         else :
             self.reconnection()
 
+    def free_frame(self, frame):
+        #The frames of a video are not reused
+        if isinstance(self.cap, CaptureLiveFrameThread) :
+            self.cap.free_frame(frame)
+
+    def get_scale(self, frame):
+        return self.video_size[0] / frame.shape[1], self.video_size[1] / frame.shape[0]
+
+    def screen_frame(self, frame, copy = False):
+        if (frame.shape[1], frame.shape[0]) != self.video_size :
+            return cv2.resize(frame, self.video_size)
+        return frame.copy() if copy else frame
+
     def local_output(self, frame):
-        self._local_output.write(frame)
+        #Only a queue put, the encoding is made by the Video_Writer thread
+        if self._local_output is not None :
+            #The buffers of a live input are reused before the end of the encoding
+            self._local_output.write(self.screen_frame(frame, isinstance(self.cap, CaptureLiveFrameThread)))
 
     def live_output(self, frame):
-        cv2.imshow('Video with Detections', frame)
+        cv2.imshow(self.window_name, frame)
         cv2.waitKey(1)
     
     def close(self):
         self.cap.release()
-        self._local_output.release()
+        #Wait for the frames still in the queue
+        if self._local_output is not None :
+            self._local_output.close()
 
     #Reconnect camera
     def reconnection(self):
-        print("\nTrying to reconnect .............")
-        self.close()
+        logger.warning("Trying to reconnect")
+        self.reconnections += 1
+        #Only the input, the local output keep recording
+        self.cap.release()
         time.sleep(5)
         self.cap = cv2.VideoCapture(self.input_name, cv2.CAP_FFMPEG)
-        self.cap = CaptureLiveFrameThread(self.cap)
+        self.cap = CaptureLiveFrameThread(self.cap, self.frame_buffers)
         if self.cap.isOpened() :
-            print("\nReconnected")
+            logger.warning("Reconnected")
 
     # Calibration   
     def calibrate(self, frame, nbr_groupe, delay, tresh_percentage, calibration_draw):
@@ -123,115 +191,150 @@ class IO :
             self._calibrate = False  
 
         if not self._calibrate :
-            #Return right and left pixel x coordinate for the offset of the barriers
-            #Using (-1, -1) as a null value
-            res = [-1, -1]
             # Format frame
             thresh1_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            # Sort pixels by luminosity
-            sorted_pixels = np.sort(thresh1_gray, axis=None)
-            # Compute index of the <tresh_percentage> % most luminous pixels
-            percent_index = int((tresh_percentage/100) * len(sorted_pixels))
-            # Get minimal value of the most luminous pixels
-            min_brightness_value = sorted_pixels[len(sorted_pixels) - percent_index]
-
-            #Ensure min brightness is below 255
-            while min_brightness_value == 255 :
-                tresh_percentage = tresh_percentage + 1
-                percent = int((tresh_percentage/100) * len(sorted_pixels))
-                min_brightness_value = sorted_pixels[len(sorted_pixels) - percent]
-                print(f'\nCalibration used {tresh_percentage}% of the pixels.')
-            #Ensure min brightness is above 230
-            while min_brightness_value <= 230 :
-                tresh_percentage = tresh_percentage - 1
-                percent = int((tresh_percentage/100) * len(sorted_pixels))
-                min_brightness_value = sorted_pixels[len(sorted_pixels) - percent]
-                print(f'\nCalibration used {tresh_percentage}% of the pixels.')
-
-            # Binary conversion, only keep 5/10% of all pixels to delete reflect
-            ret,thresh1 = cv2.threshold(thresh1_gray,min_brightness_value,255,cv2.THRESH_BINARY)
-            print(min_brightness_value)
-            cv2.imwrite('frame.png', frame)
-            cv2.imwrite('thresh.png', thresh1)
-            # Get position of the most luminous pixels, positions_max[y,x]
-            positions_max = np.where(thresh1 == 255)
-            # Convert to format (x,y)
-            positions_max = np.column_stack((positions_max[1], positions_max[0])) 
-            if calibration_draw:
-                # Create an image to mark adjacent's pixels
-                calibration_groups = np.zeros_like(thresh1)
-            # Apply "eight connectivity" for detecting contours of the regions of adjacent's pixels
-            contours, _ = cv2.findContours(thresh1, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-            # Sort contours from the biggest to the smallest
-            contours = sorted(contours, key=cv2.contourArea, reverse=True)
-            # Keep only the nbr_groupe biggest contours
-            bigger = contours[:nbr_groupe]
-            # Get the most right/left pixel of all the contours
-            rightMost = (0, 0)
-            leftMost = self.video_size
-            topMost = self.video_size
-            bottomMost = (0, 0)
-            for contour in bigger:
-                for pixel in contour:
-                    el = pixel[0]
-                    if el[0] < leftMost[0] :
-                        leftMost = el
-                    if el[0] > rightMost[0] :
-                        rightMost = el
-                    if el[1] > bottomMost[1] :
-                        bottomMost = el
-                    if el[1] < topMost[1] :
-                        topMost = el
-            
-            print(f'\nTOP : {topMost}\nBOTTOM : {bottomMost}')
-            print(f'\nLEFT : {leftMost}\nRIGHT : {rightMost}')
-
-            if calibration_draw :
-                for b in bigger:
-                    cv2.drawContours(calibration_groups, [b], -1, 255, thickness=cv2.FILLED)
-                #Calibration points
-                cv2.circle(calibration_groups, leftMost, radius=10, color=(255, 0, 0), thickness=cv2.FILLED)
-                cv2.circle(calibration_groups, rightMost, radius=10, color=(255, 0, 0), thickness=cv2.FILLED)
-                cv2.circle(calibration_groups, topMost, radius=10, color=(255, 0, 0), thickness=cv2.FILLED)
-                cv2.circle(calibration_groups, bottomMost, radius=10, color=(255, 0, 0), thickness=cv2.FILLED)
-                
-                cv2.imwrite('calibration_groups.png', calibration_groups)
-            self._calibrate = True
-            self.last_calibrate_time = time.time()
+            leftMost, rightMost, topMost, bottomMost = self.find_limits(thresh1_gray, nbr_groupe, tresh_percentage,
+                                                                        frame if calibration_draw else None)
+            self.set_calibration(leftMost, rightMost, topMost, bottomMost)
             #print("MADE CALIBRATION at "+str(self.last_calibrate_time))
             res = [leftMost[0], self.video_size[0] - rightMost[0]]
+            return res
+
+    #Publish the limits of a calibration
+    def set_calibration(self, leftMost, rightMost, topMost, bottomMost):
+        with self.calibration_lock :
             self.calibration_x = [leftMost, rightMost]
             self.calibration_y = [topMost, bottomMost]
-            return res
+            self._calibrate = True
+            self.last_calibrate_time = time.time()
+
+    #Return the extreme left/right/top/bottom pixels of the biggest groups of the most luminous pixels.
+    #If debug_frame is given, the calibration images are written in the background.
+    def find_limits(self, gray, nbr_groupe, tresh_percentage, debug_frame = None):
+        # Number of pixels for each luminosity
+        histogram = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+        # brighter_count[v] : number of pixels with a luminosity >= v
+        brighter_count = np.cumsum(histogram[::-1])[::-1]
+        start_percentage = tresh_percentage
+        # Get minimal value of the <tresh_percentage> % most luminous pixels
+        min_brightness_value = brightness_threshold(brighter_count, tresh_percentage)
+        #Ensure min brightness is below 255
+        while min_brightness_value == 255 and tresh_percentage < 100 :
+            tresh_percentage = tresh_percentage + 1
+            min_brightness_value = brightness_threshold(brighter_count, tresh_percentage)
+        #Ensure min brightness is above 230
+        while min_brightness_value <= 230 and tresh_percentage > 1 :
+            tresh_percentage = tresh_percentage - 1
+            min_brightness_value = brightness_threshold(brighter_count, tresh_percentage)
+        if tresh_percentage != start_percentage :
+            logger.info('Calibration used %d%% of the pixels.', tresh_percentage)
+
+        # Binary conversion, only keep 5/10% of all pixels to delete reflect
+        ret,thresh1 = cv2.threshold(gray,min_brightness_value,255,cv2.THRESH_BINARY)
+        logger.debug('Calibration threshold : %d', min_brightness_value)
+        # Apply "eight connectivity" for detecting contours of the regions of adjacent's pixels
+        contours, _ = cv2.findContours(thresh1, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        # Sort contours from the biggest to the smallest
+        contours = sorted(contours, key=cv2.contourArea, reverse=True)
+        # Keep only the nbr_groupe biggest contours
+        bigger = contours[:nbr_groupe]
+        # Get the most right/left pixel of all the contours
+        rightMost = (0, 0)
+        leftMost = self.video_size
+        topMost = self.video_size
+        bottomMost = (0, 0)
+        if bigger :
+            # All the pixels of the contours, format (x,y)
+            pixels = np.concatenate(bigger).reshape(-1, 2)
+            leftMost = tuple(int(v) for v in pixels[pixels[:, 0].argmin()])
+            rightMost = tuple(int(v) for v in pixels[pixels[:, 0].argmax()])
+            topMost = tuple(int(v) for v in pixels[pixels[:, 1].argmin()])
+            bottomMost = tuple(int(v) for v in pixels[pixels[:, 1].argmax()])
+        
+        logger.info('Calibration TOP : %s BOTTOM : %s LEFT : %s RIGHT : %s', topMost, bottomMost, leftMost, rightMost)
+
+        if debug_frame is not None :
+            # Create an image to mark adjacent's pixels
+            calibration_groups = np.zeros_like(thresh1)
+            for b in bigger:
+                cv2.drawContours(calibration_groups, [b], -1, 255, thickness=cv2.FILLED)
+            #Calibration points
+            for point in (leftMost, rightMost, topMost, bottomMost) :
+                cv2.circle(calibration_groups, point, radius=10, color=(255, 0, 0), thickness=cv2.FILLED)
+            #The frame is copied as it will be drawn by the next steps
+            images = {'frame.png' : debug_frame.copy(), 'thresh.png' : thresh1, 'calibration_groups.png' : calibration_groups}
+            threading.Thread(target=write_images, args=(images,), daemon=True).start()
+        return leftMost, rightMost, topMost, bottomMost
     
-    def get_formated_calibration_x(self) :
+    def get_formated_calibration_x(self, calibration_x = None) :
+        if calibration_x is None :
+            calibration_x = self.calibration_x
         #As these offset are calculated FROM the right/left extreme position, before a first calibration
         #is made, the right limit (self.calibration_x[1][0]) = 0, and thus right = 1280, wich is false.
         #To ensure that this case don't reproduce, if right's value is bigger than the middle, it's 
         #too big, and will be set to 0.  
-        return [self.calibration_x[0][0], self.calibration_x[1][0]]
+        return [calibration_x[0][0], calibration_x[1][0]]
+
+    def get_formated_calibration_y(self, calibration_y = None) :
+        if calibration_y is None :
+            calibration_y = self.calibration_y
+        return [calibration_y[0][1], calibration_y[1][1]]
 
-    def get_formated_calibration_y(self) :
-        return [self.calibration_y[0][1], self.calibration_y[1][1]]
+    #Return calibration_x and calibration_y of the same calibration
+    def get_calibration(self) :
+        with self.calibration_lock :
+            return self.calibration_x, self.calibration_y
     
     def set_manual_calibration(self, calibration_x, calibration_y) :
-        self.calibration_x = calibration_x
-        self.calibration_y = calibration_y
+        with self.calibration_lock :
+            self.calibration_x = calibration_x
+            self.calibration_y = calibration_y
+
+#Return the inputs (-i, repeated for several cameras) and the output (-o) of the arguments
+def parse_inputs(args) :
+    parser = argparse.ArgumentParser(description="")
+    parser.add_argument("-i", type=str, required=True, action="append", dest="input_files", help="Input file, one per camera")
+    parser.add_argument("-o", type=str, default=None, dest="output_file", help="Output file, need to finish with a .mp4")
+    list = parser.parse_known_args(args)[0]
+    return list.input_files, list.output_file
+
+#Return the minimal luminosity of the <tresh_percentage> % most luminous pixels
+#brighter_count : Number of pixels with a luminosity >= each value, see IO.find_limits()
+def brightness_threshold(brighter_count, tresh_percentage) :
+    percent_index = max(int((tresh_percentage/100) * brighter_count[0]), 1)
+    return int(np.flatnonzero(brighter_count >= percent_index)[-1])
+
+#Write the calibration images, called outside of the main loop
+def write_images(images) :
+    for name, image in images.items() :
+        cv2.imwrite(name, image)
 
 ####################################################################################################
 #CaptureLiveFrameThread : Class managing live input with a Thread to capture the latest frame/image.
 #                         Usefull for MultiThreading gestion(here, ret and frame), better latency and errors gestion.
+#                         The frames are decoded by the thread directly into a pool of buffers (allocated by the
+#                         first frames, at the size of the camera), and handed over without copy. A buffer come back
+#                         to the pool only when the reader free it, so a frame is never overwritten while it's used.
+#                         The reader wait on a condition, without polling.
 #Parameters :
 #   Thread : The thread to convert.
+#   nbr_buffers : The number of buffers of the pool, the reader can hold nbr_buffers - 2 frames at the same time
+#                 without the capture skipping frames.
 #Attribute :
 #   self.camera : The video flow/live input.
-#   self.frame : The last frame/image captured.
-#   self.ret : Indicate if the capture was successfull.
-#   self.lock : A lock to manage the access to shared object with the other Threads.
+#   self.frame : The last frame/image captured, not yet read.
+#   self.ret : Indicate if a new frame is waiting to be read.
+#   self.timestamp : Capture timestamp (time.time()) of the last frame.
+#   self.sequence : Sequence number of the last frame.
+#   self.condition : A condition to manage the access to shared object with the other Threads, and to wake the reader.
 #   self.lastTimeRet : Timestamp of the last frame/image.
 #   self.isOpendval : Indicate if the camera is opened.
+#   self.decoded : The number of frames decoded.
+#   self.consumed : The number of frames read.
+#   self.dropped : The number of frames replaced by a newer one before being read.
+#   self.starved : The number of frames skipped because all the buffers were held by the reader.
 #Methods :
-#   __init__(camera) : 
+#   __init__(camera, nbr_buffers) : 
 #       Initiate the thread.
 #       camera : The video flow/live input.
 #   run() : 
@@ -240,19 +343,37 @@ class IO :
 #       Close the camera and the thread.
 #       frame : The last frame.
 #   read() :
-#       Return the last frame.
+#       Wait for and return the next frame, (False, None) if the camera is closed.
+#   read_info() :
+#       Same as read(), with the capture timestamp and the sequence number of the frame.
+#   free_frame(frame) :
+#       Give the buffer of a frame read back to the pool, the frames of another capture are ignored.
 #   isOpened() :
 #       Return if the thread is working.
 ####################################################################################################
 class CaptureLiveFrameThread(threading.Thread):
 
-    def __init__(self, camera):
+    def __init__(self, camera, nbr_buffers = 3):
         self.camera = camera
 
         self.frame = None
         self.ret = False
+        self.timestamp = 0
+        self.sequence = 0
+        #Counters
+        self.decoded = 0
+        self.consumed = 0
+        self.dropped = 0
+        self.starved = 0
 
-        self.lock = threading.Lock()
+        #Pool of the buffers not used, the last frame and the frames held by the reader are not in it
+        self.free_buffers = []
+        self.nbr_buffers = max(nbr_buffers, 3)
+        self.allocated = 0
+        #The frames held by the reader, {id : frame}, until free_frame()
+        self.held_buffers = {}
+
+        self.condition = threading.Condition()
         self.lastTimeRet = datetime.now()
         self.isOpenedval = True
         super().__init__()
@@ -262,34 +383,90 @@ class CaptureLiveFrameThread(threading.Thread):
 
     def run(self):
         while self.isOpenedval:
-            ret, frame = self.camera.read()
-            with self.lock:
+            with self.condition:
+                buffer = self._get_buffer()
+            if buffer is False:
+                #The reader holds all the buffers, the frame is skipped without being decoded
+                ret, frame = self.camera.grab(), None
+            elif buffer is None:
+                #A new buffer, allocated by the decoder
+                ret, frame = self.camera.read()
+            else:
+                #Blocking until the next frame is decoded, directly in the buffer
+                ret, frame = self.camera.read(buffer)
+            timestamp = time.time()
+            with self.condition:
                 if ret:
-                    self.ret, self.frame = ret, frame
                     self.lastTimeRet = datetime.now()
-                elif (datetime.now()-self.lastTimeRet).seconds>5:
+                if ret and frame is not None:
+                    if self.ret:
+                        #The last frame was not read, its buffer can be reused
+                        self.dropped += 1
+                        self._free(self.frame)
+                    self.ret, self.frame = ret, frame
+                    self.timestamp = timestamp
+                    self.sequence += 1
+                    self.decoded += 1
+                    self.condition.notify_all()
+                    continue
+                #The buffer was not used
+                if buffer is None:
+                    self.allocated -= 1
+                elif buffer is not False:
+                    self._free(buffer)
+                if not ret and (datetime.now()-self.lastTimeRet).seconds>5:
                     self.isOpenedval = False
-            time.sleep(0.001)
+                    self.condition.notify_all()
+            if not ret:
+                #Don't retry immediately a failing camera
+                time.sleep(0.01)
 
-    def release(self):
-        with self.lock:
-            self.camera.release()
-            self.isOpenedval=False
+    #A buffer for the next frame : a free one, None for a new one while the pool is not complete, else the one of
+    #the last frame not read. False if the reader holds all of them.
+    def _get_buffer(self):
+        if self.free_buffers:
+            return self.free_buffers.pop()
+        if self.allocated < self.nbr_buffers:
+            self.allocated += 1
+            return None
+        if self.ret:
+            self.dropped += 1
+            buffer = self.frame
+            self.ret, self.frame = False, None
+            return buffer
+        self.starved += 1
+        return False
 
-    def read(self):
-        ret = False
+    def _free(self, frame):
+        self.free_buffers.append(frame)
 
-        while not ret:
-            with self.lock:
-                ret = self.ret
-                frame = self.frame
+    def free_frame(self, frame):
+        with self.condition:
+            if self.held_buffers.pop(id(frame), None) is not None:
+                self._free(frame)
 
-                self.ret = False
-            if not ret:
-                time.sleep(0.001)
+    def release(self):
+        with self.condition:
+            self.isOpenedval=False
+            self.condition.notify_all()
+        self.camera.release()
 
+    def read(self):
+        ret, frame, _, _ = self.read_info()
         return ret, frame
+
+    def read_info(self):
+        with self.condition:
+            self.condition.wait_for(lambda: self.ret or not self.isOpenedval)
+            if not self.ret:
+                return False, None, 0, 0
+            frame = self.frame
+            self.ret, self.frame = False, None
+            self.consumed += 1
+            #Back in the pool with free_frame()
+            self.held_buffers[id(frame)] = frame
+            return True, frame, self.timestamp, self.sequence
     
     def isOpened(self):
-        with self.lock:
-            return self.isOpenedval
\ No newline at end of file
+        with self.condition:
+            return self.isOpenedval
@@ -0,0 +1,220 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+logger = logging.getLogger(__name__)
+
+#Upper bounds in ms of the buckets of the latency histograms
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+#Number of recent values kept to compute the percentiles
+WINDOW = 1000
+#Returned by stage() when the metrics are disabled
+_NULL_CONTEXT = nullcontext()
+
+
+####################################################################################################
+#Metrics : Class collecting the runtime metrics (stage latencies, counters and gauges) and exposing them
+#          through a local HTTP endpoint (Prometheus text on /metrics, JSON on /json) and/or periodic JSON
+#          snapshots. When disabled, every method return immediately.
+#Parameters :
+#   bool enabled : Indicate if the metrics are collected.
+#   int port : The local port of the HTTP endpoint, 0 to disable it.
+#   String snapshot_path : The file where the JSON snapshot is written, None to disable it.
+#   float snapshot_delay : The delay in seconds beetween two snapshots (and two summaries in the log).
+#Attributes :
+#   self.histograms : The latency histograms, {name : Histogram}.
+#   self.counters : The counters, {name : value}.
+#   self.gauges : The gauges, {name : value}.
+#   self.sources : The gauges read only when a snapshot is made, {name : function}.
+#Methods :
+#   stage(name) :
+#       Context manager measuring the latency of a stage.
+#   observe(name, seconds) :
+#       Add a latency to the histogram name.
+#   increment(name, value) :
+#       Increment the counter name.
+#   set(name, value) :
+#       Set the gauge name.
+#   register(name, function) :
+#       Add a gauge read by calling function when a snapshot is made, so it cost nothing per frame.
+#   snapshot() :
+#       Return all the metrics in a dict.
+#   prometheus() :
+#       Return all the metrics in the Prometheus text format.
+#   close() :
+#       Stop the HTTP endpoint and the snapshots.
+####################################################################################################
+class Metrics :
+    def __init__(self, enabled = False, port = 0, snapshot_path = None, snapshot_delay = 10) :
+        self.enabled = enabled
+        self.snapshot_path = snapshot_path
+        self.snapshot_delay = snapshot_delay
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.sources = {}
+        self.start_time = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._server = None
+        if not enabled :
+            return
+        if port > 0 :
+            self._server = ThreadingHTTPServer(("127.0.0.1", port), _handler(self))
+            threading.Thread(target=self._server.serve_forever, name="metrics_http", daemon=True).start()
+        threading.Thread(target=self._report, name="metrics_report", daemon=True).start()
+
+    def stage(self, name) :
+        if not self.enabled :
+            return _NULL_CONTEXT
+        return _Timer(self, name)
+
+    def observe(self, name, seconds) :
+        if not self.enabled :
+            return
+        with self._lock :
+            histogram = self.histograms.get(name)
+            if histogram is None :
+                histogram = self.histograms[name] = Histogram()
+            histogram.add(seconds * 1000)
+
+    def increment(self, name, value = 1) :
+        if not self.enabled :
+            return
+        with self._lock :
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value) :
+        if not self.enabled :
+            return
+        self.gauges[name] = value
+
+    def register(self, name, function) :
+        self.sources[name] = function
+
+    def snapshot(self) :
+        gauges = dict(self.gauges)
+        for name, function in self.sources.items() :
+            try :
+                gauges[name] = function()
+            except Exception as e :
+                logger.debug('Metric %s unavailable : %s', name, e)
+        with self._lock :
+            return {
+                "time" : time.time(),
+                "uptime" : time.time() - self.start_time,
+                "counters" : dict(self.counters),
+                "gauges" : gauges,
+                "latency_ms" : {name : histogram.summary() for name, histogram in self.histograms.items()},
+            }
+
+    def prometheus(self) :
+        snapshot = self.snapshot()
+        lines = [f'uptime_seconds {snapshot["uptime"]:.3f}']
+        for name, value in snapshot["counters"].items() :
+            lines.append(f'{name}_total {value}')
+        for name, value in snapshot["gauges"].items() :
+            if isinstance(value, (int, float)) :
+                lines.append(f'{name} {float(value)}')
+        with self._lock :
+            for name, histogram in self.histograms.items() :
+                lines.extend(histogram.prometheus(f'{name}_latency_ms'))
+        return "\n".join(lines) + "\n"
+
+    def close(self) :
+        self._stop.set()
+        if self._server is not None :
+            self._server.shutdown()
+
+    #Periodic summary in the log and JSON snapshot
+    def _report(self) :
+        while not self._stop.wait(self.snapshot_delay) :
+            snapshot = self.snapshot()
+            frames = snapshot["counters"].get("frames", 0)
+            latencies = ", ".join(f'{name} p95 {summary["p95"]:.1f} ms' for name, summary in snapshot["latency_ms"].items())
+            logger.info('%d frames, %s', frames, latencies)
+            if self.snapshot_path :
+                #Written beside then moved, a reader never see a partial file
+                temporary = self.snapshot_path + ".tmp"
+                with open(temporary, "w") as file :
+                    json.dump(snapshot, file, default=float)
+                os.replace(temporary, self.snapshot_path)
+
+
+####################################################################################################
+#Histogram : Latency histogram in ms, with cumulative buckets and a window of the recent values.
+####################################################################################################
+class Histogram :
+    def __init__(self) :
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0
+        self.recent = deque(maxlen=WINDOW)
+
+    def add(self, value) :
+        index = 0
+        while index < len(BUCKETS) and value > BUCKETS[index] :
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def summary(self) :
+        recent = sorted(self.recent) or [0]
+        #Nearest rank percentiles of the recent values
+        p50, p95, p99 = (recent[min(int(len(recent) * p), len(recent) - 1)] for p in (0.5, 0.95, 0.99))
+        return {"count" : self.count, "mean" : self.sum / max(self.count, 1), "p50" : p50, "p95" : p95, "p99" : p99}
+
+    def prometheus(self, name) :
+        lines = []
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), self.counts) :
+            cumulative += count
+            lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum {self.sum}')
+        lines.append(f'{name}_count {self.count}')
+        return lines
+
+
+#Context manager of Metrics.stage()
+class _Timer :
+    def __init__(self, metrics, name) :
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self) :
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args) :
+        self.metrics.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+#HTTP handler class serving the metrics
+def _handler(metrics) :
+    class Handler(BaseHTTPRequestHandler) :
+        def do_GET(self) :
+            if self.path.startswith("/metrics") :
+                body, content_type = metrics.prometheus(), "text/plain; version=0.0.4"
+            else :
+                body, content_type = json.dumps(metrics.snapshot(), default=float), "application/json"
+            body = body.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        #No access log on stderr
+        def log_message(self, *args) :
+            pass
+
+    return Handler
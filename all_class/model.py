@@ -1,38 +1,186 @@
-import os
-import torch
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+
+from all_class import backends
 
 
 ####################################################################################################
 #Model : Class for loading and configurate a model.
 #Parameters :
-#   bool local : Indicate if the model is local or loaded from Yolo.
+#   bool local : Indicate if the model is local or loaded from Yolo (hub backend only).
+#   float model_confidence : The NMS confidence threshold.
 #   String yolo_path : The path to Yolo local librairie.
-#   String model_path : The path to the Yolo local model.
+#   String model_path : The path to the Yolo local model, or to the exported model for the other backends.
+#   String backend : The runtime of the model, "hub", "cached" (the hub model serialized on the first launch),
+#                    "torchscript", "onnx" or "openvino".
+#   int size : The input size of the model (for the exported models, the size of the export).
+#   bool quantize : Use a dynamic int8 quantization of the model.
+#   int threads : The number of intra-op threads on the CPU, 0 for the default.
+#   tuple warmup_size : The size (width, height) of a blank frame run once at the start, None to disable. The
+#                       "cached" backend is traced for frames of this size (a square input if it's None).
+#   list sizes : Other input sizes, loaded and warmed at the start to switch to them between two frames.
+#                The exported models need one export per size, "{size}" in model_path is replaced by the size.
 #Attribute :
-#   self.model : The model.
+#   self.backend : The backend running the model.
+#   self.backends : The backend of each input size.
+#   self.size : The current input size.
+#   self.settings : The NMS settings.
 #Methods :
-#   __init__(local, yolo_path, model_path) : 
+#   __init__(local, model_confidence, yolo_path, model_path, backend, size, quantize, threads, warmup_size, sizes) : 
 #       Load and initiate the Model.
-#       local : Indicate if the model is local or loaded from Yolo.
-#       yolo_path : The path to Yolo local librairie.
-#       model_path : The path to the Yolo local model.
+#   set_size(size) :
+#       Use the input size size (one of the loaded sizes) from the next frame.
+#   getDetections(frame, scale) :
+#       Return the detections (Model_Detections) of one frame.
+#       scale : The factor (x, y) from the coordinates of the frame to the ones of the detections (the screen),
+#               None to keep the coordinates of the frame. For a crop, (x, y, (height, width)) with the size of
+#               the whole frame, the crop is resized like it.
+#   getBatchDetections(frames, scales) :
+#       Return the detections of each frame, computed in one forward pass.
 ####################################################################################################
 class Model :
-    def __init__(self, local, model_confidence, yolo_path = "", model_path= ""):
+    def __init__(self, local, model_confidence, yolo_path = "", model_path= "", backend = backends.HUB, size = 640,
+                 quantize = False, threads = 0, warmup_size = None, sizes = ()):
         #Model Config
-        #Normalise the model path.
-        yolo_path = os.path.normpath(yolo_path)
-        if local :
-            self.model = torch.hub.load(yolo_path, 'custom', path=model_path, source='local')
-        else :
-            self.model = torch.hub.load('ultralytics/yolov5', 'yolov5l6', pretrained=True)
-        self.model.eval()
-        self.model.conf = model_confidence  # NMS confidence threshold
-        self.model.iou = 0.45  # NMS IoU threshold
-        self.model.agnostic = False  # NMS class-agnostic
-        self.model.multi_label = False  # NMS multiple labels per box
-        self.model.max_det = 100  # maximum number of detections per image
-        self.model.classes = [0] 
-
-    def getDetections(self,frame):
-        return self.model(frame)
\ No newline at end of file
+        self.settings = {
+            "conf" : model_confidence,  # NMS confidence threshold
+            "iou" : 0.45,  # NMS IoU threshold
+            "agnostic" : False,  # NMS class-agnostic
+            "max_det" : 100,  # maximum number of detections per image
+            "classes" : [0],
+        }
+        if threads > 0 and backend in (backends.HUB, backends.CACHED, backends.TORCHSCRIPT) :
+            import torch
+            torch.set_num_threads(threads)
+        sizes = sorted(set(sizes) | {size})
+        if len(sizes) > 1 and backend in (backends.TORCHSCRIPT, backends.ONNX, backends.OPENVINO) and "{size}" not in model_path :
+            raise ValueError(f'The {backend} backend needs one export per size, with "{{size}}" in the model path')
+        self.backends = {}
+        for input_size in sizes :
+            self.backends[input_size] = self._load(local, yolo_path, model_path.replace("{size}", str(input_size)),
+                                                   backend, input_size, quantize, threads, warmup_size)
+        self.set_size(size)
+        #The first inference allocate the memory of the runtime, made before the first real frame, at every size
+        if warmup_size is not None :
+            blank = np.zeros((warmup_size[1], warmup_size[0], 3), dtype=np.uint8)
+            for input_backend in self.backends.values() :
+                input_backend.infer([blank])
+
+    def _load(self, local, yolo_path, model_path, backend, size, quantize, threads, frame_size) :
+        if backend == backends.HUB :
+            #The hub model is loaded once, only the input size change
+            if self.backends :
+                return next(iter(self.backends.values())).with_size(size)
+            return backends.Hub_Backend(local, yolo_path, model_path, self.settings, size, quantize)
+        elif backend == backends.CACHED :
+            return backends.cached_backend(local, yolo_path, model_path, self.settings, size, frame_size)
+        elif backend == backends.TORCHSCRIPT :
+            return backends.TorchScript_Backend(model_path, self.settings, size)
+        elif backend == backends.ONNX :
+            return backends.Onnx_Backend(model_path, self.settings, size, quantize, threads)
+        elif backend == backends.OPENVINO :
+            return backends.OpenVINO_Backend(model_path, self.settings, size, threads)
+        raise ValueError(f'Unknown model backend : {backend}')
+
+    def set_size(self, size) :
+        self.backend = self.backends[size]
+        self.size = size
+
+    def getDetections(self, frame, scale = None):
+        return self.getBatchDetections([frame], [scale])[0]
+
+    def getBatchDetections(self, frames, scales = None):
+        return [Model_Detections(detections) for detections in self.backend.infer(frames, scales)]
+
+
+####################################################################################################
+#Model_Detections : Detections of one frame, with the same attribute as the results of the YOLO model
+#                   used by the other classes.
+#Parameters :
+#   array xyxy : The detections, one row [x1, y1, x2, y2, confidence, class] per box.
+#Attributes :
+#   self.xyxy : List containing the detections of the frame.
+####################################################################################################
+class Model_Detections :
+    def __init__(self, xyxy) :
+        self.xyxy = [xyxy]
+
+
+#Convert a tensor (on any device) or an array of detections to a float NumPy array
+def to_numpy(detections) -> np.ndarray:
+    #A torch tensor, checked without importing torch
+    if hasattr(detections, "detach"):
+        detections = detections.detach().cpu().numpy()
+    return np.asarray(detections, dtype=np.float64).reshape(-1, 6)
+
+
+####################################################################################################
+#Batch_Model : Class gathering the frames of several consumers to run them in one forward pass.
+#Parameters :
+#   Model model : The model to use.
+#   int max_batch_size : The maximum number of frames in one forward pass.
+#   float max_wait : The maximum time in seconds to wait for other frames after the first one.
+#Attributes :
+#   self.requests : The queue of frames waiting for the model, with their Future.
+#   self.latency : The time in seconds per frame of the last forward pass, None before the first one.
+#   self.latency_size : The input size of the model during the last forward pass, None if it has none.
+#   self.batch_count : The number of forward pass made.
+#   self.frame_count : The number of frames processed.
+#Methods :
+#   submit(frame, scale) :
+#       Add a frame to the next batch and return a Future of its detections (see Model.getDetections()).
+#   getDetections(frame, scale) :
+#       Same as Model.getDetections(frame, scale), wait for the batch of the frame to be processed.
+####################################################################################################
+class Batch_Model :
+    def __init__(self, model, max_batch_size, max_wait = 0.05) :
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.latency = None
+        self.latency_size = None
+        self.batch_count = 0
+        self.frame_count = 0
+        self._thread = threading.Thread(target=self._run, name="batch_model", daemon=True)
+        self._thread.start()
+
+    def submit(self, frame, scale = None) :
+        future = Future()
+        self.requests.put((frame, scale, future))
+        return future
+
+    def getDetections(self, frame, scale = None) :
+        return self.submit(frame, scale).result()
+
+    def _run(self) :
+        while True :
+            batch = [self.requests.get()]
+            #Wait for other frames until the batch is full or the time is over
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size :
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 :
+                    break
+                try :
+                    batch.append(self.requests.get(timeout=remaining))
+                except queue.Empty :
+                    break
+            #The size can change during the pass, its time is given to the size it started with
+            size = getattr(self.model, "size", None)
+            start = time.perf_counter()
+            try :
+                results = self.model.getBatchDetections([frame for frame, _, _ in batch], [scale for _, scale, _ in batch])
+            except Exception as e :
+                for _, _, future in batch :
+                    future.set_exception(e)
+                continue
+            self.latency = (time.perf_counter() - start) / len(batch)
+            self.latency_size = size
+            self.batch_count += 1
+            self.frame_count += len(batch)
+            for (_, _, future), result in zip(batch, results) :
+                future.set_result(result)
\ No newline at end of file
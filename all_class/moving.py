@@ -1,58 +1,129 @@
 import numpy as np
 
 
+#Metrics of the deplacement
+METRIC_X = "x"
+METRIC_Y = "y"
+METRIC_EUCLIDEAN = "euclidean"
+#Age of an empty entry of the history, always older than the window
+_EMPTY_AGE = np.iinfo(np.int64).min // 2
+
+
 #######################################################
 #Moving : Class for storing old position information and decide whether they are moving or not
 #Detection_Process(object, frame, 2, 0.35)
 #Parameters :
 #   diff_dist : The difference in px which is considered as a move.
+#   nbr_frame : The number of frame to use for the estimation of the deplacement.
+#   metric : The deplacement used, "x", "y" or "euclidean".
+#   max_tracks : The number of tracks preallocated, doubled when needed.
 #Attribute :
-#   self.all_moves : All the ancient movements.
+#   self.rows : Row of each tracked id in the history arrays.
+#   self.ages : Ring buffer of the ages of the last positions of each track.
+#   self.positions : Ring buffer of the last positions (x, y) of each track.
+#   self.heads : Index of the next entry to write in the ring buffer of each track.
 #   diff_dist : The difference in px which is considered as a move.
-#   self.nbr_frame : The number of frame to use for the estimation of the deplacement. 
+#   self.nbr_frame : The number of frame to use for the estimation of the deplacement.
 class Moving:
-    def __init__(self, diff_dist, nbr_frame) :
-        self.all_moves = []
+    def __init__(self, diff_dist, nbr_frame, metric = METRIC_X, max_tracks = 64) :
+        if metric not in (METRIC_X, METRIC_Y, METRIC_EUCLIDEAN) :
+            raise ValueError(f'Unknown moving metric : {metric}')
         self.diff_dist = diff_dist
         self.nbr_frame = nbr_frame
+        self.metric = metric
+        # The current position and the nbr_frame previous ones
+        self.size = nbr_frame + 1
+        # Order of the ring buffer from the oldest to the newest entry, for each head
+        self.orders = (np.arange(self.size)[None, :] + np.arange(self.size)[:, None]) % self.size
+        self.rows = {}
+        self.free_rows = []
+        self._allocate(max_tracks)
+
+    def _allocate(self, max_tracks) :
+        old_size = len(self.free_rows) + len(self.rows)
+        ages = np.full((max_tracks, self.size), _EMPTY_AGE, dtype=np.int64)
+        positions = np.zeros((max_tracks, self.size, 2), dtype=np.float64)
+        heads = np.zeros(max_tracks, dtype=np.int64)
+        if old_size > 0 :
+            ages[:old_size] = self.ages
+            positions[:old_size] = self.positions
+            heads[:old_size] = self.heads
+        self.ages = ages
+        self.positions = positions
+        self.heads = heads
+        # Reversed to reuse the lowest rows first
+        self.free_rows.extend(range(max_tracks - 1, old_size - 1, -1))
+
+    def _get_row(self, id) :
+        row = self.rows.get(id)
+        if row is None :
+            if not self.free_rows :
+                self._allocate(max(2 * len(self.rows), 1))
+            row = self.free_rows.pop()
+            self.rows[id] = row
+        return row
 
     def get_moving(self, id, age, center) -> bool :
         # Register new move
-        self.all_moves.append([id, age, center])
-        res = True
-        # List of all last center of the current object
-        last_moves = []
-        # Getting all last moves
-        for move in self.all_moves:
-            move_age = move[1]
-            move_x = move[2][0]
-            #move_y = move[2][1]
-            # Last frame
-            if (move[0] == id and move[1] >= age - self.nbr_frame):
-                # TODO : PARAMETER TO GET THE OUTPUT ABOUT X OR X AND Y OR Y
-                # Diff with X and Y
-                # diff = math.sqrt((abs(move[2][0] - center[0]) ** 2 +  abs(move[2][1] - center[1]) ** 2))
-                # Diff with only X
-                last_moves.append([move_age, move_x]) 
-        # Sort list by age
-        last_moves.sort(key=lambda x:x[0])
-        all_diff = []
+        row = self._get_row(id)
+        head = self.heads[row]
+        self.ages[row, head] = age
+        self.positions[row, head] = center[0], center[1]
+        self.heads[row] = (head + 1) % self.size
+        # All last positions of the current object, from the oldest to the newest
+        order = self.orders[self.heads[row]]
+        ages = self.ages[row, order]
+        positions = self.positions[row, order][ages >= age - self.nbr_frame]
         # Differences for all last moves with the next one
-        for i in range(len(last_moves) - 1):
-            diff = abs(last_moves[i][1] - last_moves[i+1][1])
-            all_diff.append(diff)
+        steps = np.diff(positions, axis=0)
+        if self.metric == METRIC_X :
+            all_diff = np.abs(steps[:, 0])
+        elif self.metric == METRIC_Y :
+            all_diff = np.abs(steps[:, 1])
+        else :
+            all_diff = np.hypot(steps[:, 0], steps[:, 1])
         # Mean of all last moves
         # No calculation and considered as moving if all_diff is empty
-        mean = self.diff_dist + 1
-        if len(all_diff) > 0 :
-            mean = np.mean(all_diff)
-        # Result
-        if (mean <= self.diff_dist):
-            res = False
-
-        # Clearing older moves
-        # Another loop to prevent alterate self.all_moves while calculation diff.
-        for move in self.all_moves:
-            if(move[0] == id and move[1] < age - self.nbr_frame):
-                self.all_moves.remove(move)
-        return res
\ No newline at end of file
+        if len(all_diff) == 0 :
+            return True
+        return bool(all_diff.mean() > self.diff_dist)
+
+    # get_moving() for all the tracks of a frame at once, return an array of bool
+    def get_movings(self, ids, ages, centers) -> np.ndarray :
+        # The same id twice would write the same row twice
+        if len(set(ids)) != len(ids) :
+            return np.array([self.get_moving(id, age, center) for id, age, center in zip(ids, ages, centers)], dtype=bool)
+        rows = np.array([self._get_row(id) for id in ids], dtype=np.int64)
+        # Register new moves
+        heads = self.heads[rows]
+        self.ages[rows, heads] = ages
+        self.positions[rows, heads] = centers
+        heads = (heads + 1) % self.size
+        self.heads[rows] = heads
+        # All last positions of each object, from the oldest to the newest
+        orders = self.orders[heads]
+        track_ages = self.ages[rows[:, None], orders]
+        positions = self.positions[rows[:, None], orders]
+        # The ages increase, the positions in the window are the last ones
+        valid = track_ages >= (np.asarray(ages) - self.nbr_frame)[:, None]
+        valid = valid[:, 1:] & valid[:, :-1]
+        steps = np.diff(positions, axis=1)
+        if self.metric == METRIC_X :
+            all_diff = np.abs(steps[:, :, 0])
+        elif self.metric == METRIC_Y :
+            all_diff = np.abs(steps[:, :, 1])
+        else :
+            all_diff = np.hypot(steps[:, :, 0], steps[:, :, 1])
+        # Mean of all last moves, considered as moving without any
+        counts = valid.sum(axis=1)
+        means = np.where(valid, all_diff, 0).sum(axis=1) / np.maximum(counts, 1)
+        return (counts == 0) | (means > self.diff_dist)
+
+    # Forget the tracks which are not in alive_ids anymore
+    def clean(self, alive_ids) :
+        alive_ids = set(alive_ids)
+        for id in [id for id in self.rows if id not in alive_ids] :
+            row = self.rows.pop(id)
+            self.ages[row] = _EMPTY_AGE
+            self.heads[row] = 0
+            self.free_rows.append(row)
@@ -1,5 +1,20 @@
+import heapq
+import logging
 import time
-from pythonosc import udp_client
+from pythonosc import udp_client, osc_bundle_builder, osc_message_builder
+
+
+#Output modes
+#One message per information
+MESSAGE = "message"
+#All the informations of a frame in one bundle
+BUNDLE = "bundle"
+#Only the slots that changed in one bundle, with all the slots every keyframe_interval frames
+DELTA = "delta"
+#Maximum number of messages in one bundle, to keep each datagram small
+MAX_BUNDLE_MESSAGES = 300
+
+logger = logging.getLogger(__name__)
 
 
 ####################################################################################################
@@ -8,12 +23,19 @@ from pythonosc import udp_client
 #   int nbr_people_max: The maximum number of people tracked simultanously
 #   String ip : The IP of the client. Default : 127.0.0.1
 #   int port : The port of the client. Default : 5005
+#   String output_mode : "message" (one datagram per information), "bundle" (one bundle per frame)
+#                        or "delta" (one bundle with only the slots that changed).
+#   int keyframe_interval : In delta mode, the number of frames beetween two sendings of all the slots.
 #Attributes :
 #   self.client : The udp (and osc) client.
 #   self.info_list : The list of all tracked people's informations. Format : [id, inside/outside, moving, position in %].
-#   self.crossing_cache : The list to store tracked people when they disapear in the middle of the detection's zone,
-#                         meaning they're hidden by another person.
-#   self.crossing_age : The age of each person stored in the crossing_cache.
+#   self.crossing : The tracked people who disapeared in the middle of the detection's zone, meaning they're
+#                   hidden by another person. Format : {id : [informations, time of the disparition]}.
+#   self.slot_of : The slot of each tracked (or cached) id.
+#   self.free_slots : Heap of the empty slots, the first empty slot is always used first.
+#   self.countdown_slots : The slots of the people leaving, during their countdown.
+#   self.last_sent : The last informations sent for each slot, used by the delta mode.
+#   self.frame_count : The number of frames sent.
 #Methods :
 #   __init__(nbr_people_max, ip, port) :
 #       Initiate the osc client.
@@ -32,11 +54,22 @@ from pythonosc import udp_client
 #       leaving_offset : Distance offset in % from the start/end of the installation to accept that a person left the detection.
 #       time_to_let_go : Time difference in seconds after which we suppress a cached person definitively.
 #       reappear_offset : Distance offset in % beetween the old and the new detection to accept that it was the same person.
+#   leave(pos) :
+#       Start the countdown of the person in the slot pos.
+#   send_slots() :
+#       Send the informations of the slots, following the output mode.
+#   configure(ip, port, output_mode, keyframe_interval) :
+#       Change the destination and the output mode while running, the slots are kept.
 ####################################################################################################
 
 class OSC_Client:
 
-    def __init__(self, nbr_people_max, nbr_info, ip = "192.168.10.201", port = 5005) :
+    def __init__(self, nbr_people_max, nbr_info, ip = "192.168.10.201", port = 5005, output_mode = MESSAGE, keyframe_interval = 30) :
+        if output_mode not in (MESSAGE, BUNDLE, DELTA) :
+            raise ValueError(f'Unknown OSC output mode : {output_mode}')
+        self.output_mode = output_mode
+        self.keyframe_interval = max(keyframe_interval, 1)
+        self.destination = (ip, port)
         self.client = udp_client.SimpleUDPClient(ip, port)
         # 4 is an id plus the number of informations to send, here 3
         self.info_list = [[0 for _ in range(nbr_info + 1)] for _ in range(nbr_people_max)]
@@ -44,12 +77,58 @@ class OSC_Client:
         for el in self.info_list :
             el[2] = True
         
-        self.crossing = []
-        self.age_inside = []
+        self.crossing = {}
+        self.slot_of = {}
+        self.free_slots = list(range(nbr_people_max))
+        self.countdown_slots = set()
+        self.last_sent = [None] * nbr_people_max
+        self.frame_count = 0
     
+    def configure(self, ip, port, output_mode = MESSAGE, keyframe_interval = 30) :
+        if output_mode not in (MESSAGE, BUNDLE, DELTA) :
+            raise ValueError(f'Unknown OSC output mode : {output_mode}')
+        if (ip, port) != self.destination :
+            self.destination = (ip, port)
+            self.client = udp_client.SimpleUDPClient(ip, port)
+        self.output_mode = output_mode
+        self.keyframe_interval = max(keyframe_interval, 1)
+        #The new destination (or mode) receive all the slots on the next frame
+        self.last_sent = [None] * len(self.last_sent)
+
     def send(self, header, msg) :
         self.client.send_message(header, msg)
 
+    def send_bundle(self, messages) :
+        for start in range(0, len(messages), MAX_BUNDLE_MESSAGES) :
+            bundle = osc_bundle_builder.OscBundleBuilder(time.time())
+            for header, msg in messages[start:start + MAX_BUNDLE_MESSAGES] :
+                message = osc_message_builder.OscMessageBuilder(address=header)
+                message.add_arg(msg)
+                bundle.add_content(message.build())
+            self.client.send(bundle.build())
+
+    def send_slots(self) :
+        #Every keyframe_interval frames, all the slots are sent even in delta mode
+        keyframe = self.frame_count % self.keyframe_interval == 0
+        self.frame_count += 1
+        messages = []
+        for i in range(len(self.info_list)) :
+            element = self.info_list[i]
+            state = (element[1], element[2], element[3])
+            if self.output_mode == DELTA and not keyframe and self.last_sent[i] == state :
+                continue
+            self.last_sent[i] = state
+            header = "/detect/"+str(i)+"/"
+            messages.append((header+"in", element[1]))
+            messages.append((header+"move", element[2]))
+            messages.append((header+"pos", element[3]))
+
+        if self.output_mode == MESSAGE :
+            for header, msg in messages :
+                self.send(header, msg)
+        elif messages :
+            self.send_bundle(messages)
+
     def init_leaving(self,person) : 
         # Negative id for the countdown   
         person[0] = -1
@@ -58,96 +137,92 @@ class OSC_Client:
         # Resetting move to true
         person[2] = True
 
+    #Start the countdown of the person in the slot pos
+    def leave(self, pos) :
+        person = self.info_list[pos]
+        del self.slot_of[person[0]]
+        self.init_leaving(person)
+        self.countdown_slots.add(pos)
+
     def send_info(self, detection_list, countdown, leaving_offset, time_to_let_go, appear_offset) :
-        print(f'\n\nOLD : {self.info_list}\n\nNEW : {detection_list}\n\nCACHED : {self.crossing}\n\n')
-        # DEPARTURE GESTION
+        if logger.isEnabledFor(logging.DEBUG) :
+            logger.debug('OLD : %s NEW : %s CACHED : %s', self.info_list, detection_list, list(self.crossing.values()))
+        now = time.time()
+        detected_ids = {row[0] for row in detection_list}
+        # COUNTDOWN GESTION
         countdown = - abs(countdown)
-        for i in range(len(self.info_list)) :
+        #Negative id are used for countdown
+        for i in list(self.countdown_slots) :
+            id = self.info_list[i][0]
+            if id > countdown : 
+                #Count frame age until countdown
+                self.info_list[i][0] = id - 1
+            else :
+                #If we achieved the countdown
+                self.info_list[i] = [0, 0, True, 0]
+                self.countdown_slots.remove(i)
+                heapq.heappush(self.free_slots, i)
+
+        # DEPARTURE GESTION
+        for id, i in list(self.slot_of.items()) :
+            #If the id was in the ancient info, but not in the new one
+            if id in detected_ids or id in self.crossing :
+                continue
             info = self.info_list[i]
-            id = info[0]
-            #Negative id are used for countdown
-            if not id <= 0 :
-                if not (any(row[0] == id for row in detection_list)):
-                    #If the id was in the ancient info, but not in the new one
-                    #Crossing gestion
-                    if (info[3] > leaving_offset and info[3] < 100-leaving_offset) :
-                        #If disparition inside the zone of detection, add the tracking to the cache and keep it in all_info.
-                        if not (any(row[0] == info for row in self.crossing)) :
-                            #Always keeping move to true unless it's detected
-                            info[2] = True
-                            self.crossing.append([info, time.time()])
-                    else :
-                        #Real leaving
-                        self.init_leaving(info)
-            elif id < 0 :
-                #Countdown gestion
-                if id > countdown : 
-                    #Count frame age until countdown
-                    info[0] = id - 1
-                else :
-                    #If we achieved the countdown
-                    self.info_list[i] = [0, 0, True, 0]
+            #Crossing gestion
+            if (info[3] > leaving_offset and info[3] < 100-leaving_offset) :
+                #If disparition inside the zone of detection, add the tracking to the cache and keep it in all_info.
+                #Always keeping move to true unless it's detected
+                info[2] = True
+                self.crossing[id] = [info, now]
+            else :
+                #Real leaving
+                self.leave(i)
 
         #Crossing gestion
-        #Reapparition of a cached person detected by the models           
-        for cached in self.crossing :
-            if (any(row[0] == cached[0][0] for row in detection_list)):
-                self.crossing.remove(cached)
-                print(f'\n\nREAPPEARED (detected by the models) : {cached}\n')
-            else :
-                #Adding the cached person to the detection_list, to keep it in the detection
-                detection_list.append(cached[0])  
-
-        #Leaving because the time has passed 
-        for cached in self.crossing :
-            age = cached[1]
-            if (time.time() - age >= time_to_let_go) :
-                print(f'\n\nTIME PASSED : {cached}\n')
-                person = self.info_list[self.info_list.index(cached[0])]
-                self.init_leaving(person)
-                detection_list.remove(person)
-                self.crossing.remove(cached)
+        for id, cached in list(self.crossing.items()) :
+            #Reapparition of a cached person detected by the models           
+            if id in detected_ids :
+                del self.crossing[id]
+                logger.debug('REAPPEARED (detected by the models) : %s', cached)
+            #Leaving because the time has passed 
+            elif now - cached[1] >= time_to_let_go :
+                logger.debug('TIME PASSED : %s', cached)
+                del self.crossing[id]
+                self.leave(self.slot_of[id])
+            #Else the cached person keep its slot and its last informations
 
         #Update gestion : Update self.info_list with new_info
         #Needed to launch the calibration only when a new person enter in the detection
         new_person = False
         for info in detection_list:
             #UPDATE ALREADY PRESENT DETECTION
-            #Getting the position of the concerned id if exists, else =-1
-            try :
-                pos = list(zip(*self.info_list))[0].index(info[0])
-            except ValueError :
-                pos = -1
+            pos = self.slot_of.get(info[0])
             #If the id already in the list, replace by new value
-            if not pos==-1 :
+            if pos is not None :
                 self.info_list[pos] = info
+                continue
             #DETECTION IS NOT IN THE OLD INFO
-            else :    
-                #Replace represent the fact that the new person was an old one and don't need to be added.
-                replace = False
-                #Reapparition of and old person with a new id
-                for cached in self.crossing :
-                    id = cached[0][0]
-                    print(f'\nCached info to compare : {cached}')
-                    if (abs(info[3] - cached[0][3]) <= appear_offset): #and (info[0] == id)
-                        print(f'\n\nREAPPEARED (not detected) : {cached}\n')
-                        pos = list(zip(*self.info_list))[0].index(id)
-                        self.info_list[pos] = info
-                        self.crossing.remove(cached)
-                        detection_list.remove(cached[0])
-                        replace = True
-                #Else, we store it in the first empty slot, and we send the signal for the calibration
-                if not replace :
-                    for i in range(len(self.info_list)) :
-                        if self.info_list[i][0] == 0 and not new_person:
-                            self.info_list[i] = info
-                            new_person = True
+            #Replace represent the fact that the new person was an old one and don't need to be added.
+            replace = False
+            #Reapparition of and old person with a new id
+            for id, cached in self.crossing.items() :
+                if (abs(info[3] - cached[0][3]) <= appear_offset):
+                    logger.debug('REAPPEARED (not detected) : %s', cached)
+                    pos = self.slot_of.pop(id)
+                    self.info_list[pos] = info
+                    self.slot_of[info[0]] = pos
+                    del self.crossing[id]
+                    replace = True
+                    break
+            #Else, we store it in the first empty slot, and we send the signal for the calibration
+            #Only one new person per frame, the others get a slot on the next frames
+            if not replace and not new_person and self.free_slots :
+                pos = heapq.heappop(self.free_slots)
+                self.info_list[pos] = info
+                self.slot_of[info[0]] = pos
+                new_person = True
 
-        for i in range(len(self.info_list)) :
-            element = self.info_list[i]
-            header = "/detect/"+str(i)+"/"
-            self.send(header+"in", element[1])
-            self.send(header+"move", element[2])
-            self.send(header+"pos", element[3])
+        self.send_slots()
 
         return new_person
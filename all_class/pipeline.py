@@ -0,0 +1,190 @@
+import logging
+import queue
+import threading
+import time
+
+
+#Policies when the queue of the next stage is full
+BLOCK = "block"
+DROP_OLDEST = "drop_oldest"
+#Value passed through the queues to stop the stages one after the other
+_END = object()
+
+logger = logging.getLogger(__name__)
+
+
+####################################################################################################
+#Pipeline : Class running each processing stage in its own thread, connected by bounded queues,
+#           so the frame rate is limited by the slowest stage and not by the sum of all stages.
+#Parameters :
+#   int queue_size : The maximum number of items waiting in front of each stage.
+#   String policy : What to do when a queue is full, "block" (wait) or "drop_oldest" (drop the oldest item).
+#   float report_delay : The delay in seconds beetween each throughput report, 0 to disable it.
+#   on_drop : Called with each item dropped by the policy, to free what it holds. None to do nothing.
+#Attributes :
+#   self.stages : All the stages, in order.
+#   self.source_count : The number of items produced by the source.
+#   self.stop_event : Event set to stop all the stages.
+#Methods :
+#   add_stage(name, function) :
+#       Add a stage at the end of the pipeline.
+#       name : The name of the stage, used in the reports.
+#       function : Called with the item of the previous stage, return the item for the next one.
+#                  Returning None drop the item.
+#   run(source) :
+#       Start the stages and feed them until the source return None or stop() is called.
+#       source : Called without argument, return the next item or None at the end.
+#   stop() :
+#       Stop the source and all the stages.
+#   get_throughput() :
+#       Return the throughput informations of each stage.
+####################################################################################################
+class Pipeline :
+    def __init__(self, queue_size, policy = BLOCK, report_delay = 10, on_drop = None) :
+        if policy not in (BLOCK, DROP_OLDEST) :
+            raise ValueError(f'Unknown queue policy : {policy}')
+        self.queue_size = queue_size
+        self.policy = policy
+        self.report_delay = report_delay
+        self.on_drop = on_drop
+        self.stages = []
+        self.source_count = 0
+        self.stop_event = threading.Event()
+        self._error = None
+        self._last_report = time.perf_counter()
+
+    def add_stage(self, name, function) :
+        stage = Stage(name, function, queue.Queue(maxsize=self.queue_size), self)
+        if self.stages :
+            self.stages[-1].next_stage = stage
+        self.stages.append(stage)
+
+    def run(self, source) :
+        self.stop_event.clear()
+        for stage in self.stages :
+            stage.start()
+        try :
+            while not self.stop_event.is_set() :
+                item = source()
+                if item is None :
+                    break
+                self.source_count += 1
+                self.put(self.stages[0], item)
+                self._report()
+        finally :
+            #Let the stages finish the items already in the queues
+            self.put(self.stages[0], _END, True)
+            for stage in self.stages :
+                stage.join()
+        if self._error is not None :
+            raise self._error
+
+    def stop(self, error = None) :
+        if error is not None and self._error is None :
+            self._error = error
+        self.stop_event.set()
+
+    #Put an item in the queue of a stage, following the policy
+    def put(self, stage, item, force_block = False) :
+        output_queue = stage.input_queue
+        if self.policy == DROP_OLDEST and not force_block :
+            while True :
+                try :
+                    output_queue.put_nowait(item)
+                    return
+                except queue.Full :
+                    try :
+                        dropped = output_queue.get_nowait()
+                        stage.dropped += 1
+                    except queue.Empty :
+                        continue
+                    if self.on_drop is not None :
+                        self.on_drop(dropped)
+        #Timeout to never stay blocked when another stage stopped
+        while not self.stop_event.is_set() or item is _END :
+            try :
+                output_queue.put(item, timeout=0.1)
+                return
+            except queue.Full :
+                if self.stop_event.is_set() :
+                    return
+
+    def get_throughput(self) :
+        now = time.perf_counter()
+        throughput = {}
+        for stage in self.stages :
+            throughput[stage.name] = stage.get_throughput(now)
+        return throughput
+
+    def _report(self) :
+        if self.report_delay <= 0 or time.perf_counter() - self._last_report < self.report_delay :
+            return
+        self._last_report = time.perf_counter()
+        text = []
+        for name, info in self.get_throughput().items() :
+            text.append(f'{name} : {info["fps"]:.1f} fps, busy {info["busy"]:.0%}, queue {info["queue"]}, dropped {info["dropped"]}')
+        logger.info("PIPELINE : %s", " | ".join(text))
+
+
+####################################################################################################
+#Stage : Thread running one function of the pipeline.
+#Parameters :
+#   String name : The name of the stage.
+#   function : The function to apply on each item.
+#   Queue input_queue : The queue containing the items to process.
+#   Pipeline pipeline : The pipeline containing the stage.
+#Attributes :
+#   self.next_stage : The next stage, None for the last one.
+#   self.count : The number of items processed.
+#   self.busy_time : The time in seconds spent in the function.
+#   self.dropped : The number of items dropped in front of this stage because its queue was full.
+####################################################################################################
+class Stage(threading.Thread) :
+    def __init__(self, name, function, input_queue, pipeline) :
+        super().__init__(name=name, daemon=True)
+        self.function = function
+        self.input_queue = input_queue
+        self.next_stage = None
+        self.pipeline = pipeline
+        self.count = 0
+        self.busy_time = 0
+        self.dropped = 0
+        #Values at the last throughput computation
+        self._last_time = time.perf_counter()
+        self._last_count = 0
+        self._last_busy_time = 0
+
+    def run(self) :
+        while not self.pipeline.stop_event.is_set() :
+            try :
+                item = self.input_queue.get(timeout=0.1)
+            except queue.Empty :
+                continue
+            if item is _END :
+                break
+            start = time.perf_counter()
+            try :
+                result = self.function(item)
+            except Exception as e :
+                self.pipeline.stop(e)
+                break
+            self.busy_time += time.perf_counter() - start
+            self.count += 1
+            if result is not None and self.next_stage is not None :
+                self.pipeline.put(self.next_stage, result)
+        if self.next_stage is not None :
+            self.pipeline.put(self.next_stage, _END, True)
+
+    def get_throughput(self, now) :
+        elapsed = max(now - self._last_time, 1e-9)
+        info = {
+            "frames" : self.count,
+            "fps" : (self.count - self._last_count) / elapsed,
+            "busy" : (self.busy_time - self._last_busy_time) / elapsed,
+            "queue" : self.input_queue.qsize(),
+            "dropped" : self.dropped,
+        }
+        self._last_time = now
+        self._last_count = self.count
+        self._last_busy_time = self.busy_time
+        return info
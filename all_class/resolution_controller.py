@@ -0,0 +1,103 @@
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+#Weight of the last value in the moving averages
+SMOOTHING = 0.1
+#Number of times frames after which the number of people of the last lowering is forgotten
+PEOPLE_DWELLS = 10
+
+
+####################################################################################################
+#Resolution_Controller : Class choosing the input size of the model among the sizes loaded and warmed by the Model,
+#                        to hold a target frame rate : a smaller size when the frames take too long, a bigger one
+#                        when its predicted cost (the inference grows with the square of the size) stay under the
+#                        budget with a margin. Each change needs the condition during frames frames, and after
+#                        a change to a smaller size, the size only grows back with at most as many people as then,
+#                        until it grows back or PEOPLE_DWELLS times frames frames passed.
+#Parameters :
+#   list sizes : The input sizes of the model.
+#   int size : The input size at the start.
+#   float target_fps : The frame rate to hold.
+#   float margin : The fraction of the budget kept free by a bigger size.
+#   int frames : The number of frames a condition must hold before a change, and the minimum time beetween two.
+#   bool parallel : Indicate if the inference run beside the other stages (pipeline), the cost of a frame is then
+#                   the slowest of them, else their sum.
+#Attributes :
+#   self.size : The input size chosen.
+#   self.latency : The mean inference time in seconds per frame at the current size.
+#   self.rest : The mean time in seconds of the other stages of a frame.
+#   self.switches : The number of changes of size.
+#Methods :
+#   report_latency(latency, size) :
+#       Add the inference time in seconds of a frame (divided by the frames between two detections).
+#       size : The input size it was measured at, the times of another size than the current one are ignored.
+#   report_frame(rest, nbr_people) :
+#       Add the time in seconds of the rest of a frame and the number of people in it, return the size to use.
+#   configure(target_fps, margin, frames) :
+#       Change the parameters while running.
+####################################################################################################
+class Resolution_Controller :
+    def __init__(self, sizes, size, target_fps, margin = 0.2, frames = 30, parallel = False) :
+        self.sizes = sorted(sizes)
+        self.size = size
+        self.parallel = parallel
+        self.configure(target_fps, margin, frames)
+        self.latency = None
+        self.rest = 0
+        self.switches = 0
+        #Frames since the last change, and frames the conditions of a change hold
+        self._since_switch = 0
+        self._over = 0
+        self._under = 0
+        #The number of people when the size was lowered, None if it didn't happen
+        self._people_at_down = None
+
+    def configure(self, target_fps, margin = 0.2, frames = 30) :
+        self.budget = 1 / target_fps
+        self.margin = margin
+        self.frames = frames
+
+    def report_latency(self, latency, size = None) :
+        if size is not None and size != self.size :
+            return
+        self.latency = latency if self.latency is None else (1 - SMOOTHING) * self.latency + SMOOTHING * latency
+
+    def report_frame(self, rest, nbr_people) :
+        self.rest = (1 - SMOOTHING) * self.rest + SMOOTHING * rest
+        self._since_switch += 1
+        if self._people_at_down is not None and self._since_switch >= PEOPLE_DWELLS * self.frames :
+            self._people_at_down = None
+        if self.latency is None :
+            return self.size
+        index = self.sizes.index(self.size)
+        self._over = self._over + 1 if self._cost(self.latency) > self.budget else 0
+        if index + 1 < len(self.sizes) :
+            predicted = self._cost(self.latency * (self.sizes[index + 1] / self.size) ** 2)
+            calmer = self._people_at_down is None or nbr_people <= self._people_at_down
+            self._under = self._under + 1 if predicted < self.budget * (1 - self.margin) and calmer else 0
+        if self._since_switch < self.frames :
+            return self.size
+        if index > 0 and self._over >= self.frames :
+            self._people_at_down = nbr_people
+            self._switch(self.sizes[index - 1])
+        elif index + 1 < len(self.sizes) and self._under >= self.frames :
+            self._people_at_down = None
+            self._switch(self.sizes[index + 1])
+        return self.size
+
+    #The time of a frame for an inference time
+    def _cost(self, latency) :
+        return max(latency, self.rest) if self.parallel else latency + self.rest
+
+    def _switch(self, size) :
+        logger.info('Model input size %d -> %d (inference %.1f ms, rest %.1f ms, budget %.1f ms)', self.size, size,
+                    self.latency * 1000, self.rest * 1000, self.budget * 1000)
+        #Predicted at the new size until it's measured
+        self.latency *= (size / self.size) ** 2
+        self.size = size
+        self.switches += 1
+        self._since_switch = 0
+        self._over = 0
+        self._under = 0
@@ -0,0 +1,77 @@
+from all_class.model import Model_Detections, to_numpy
+
+
+####################################################################################################
+#Roi : Class cropping the frame to the calibrated zone before the inference, and moving the detections
+#      of the crop back to the coordinates of the full frame. The zone is in the coordinates of the screen,
+#      the frame can have another size (the size of the camera).
+#Parameters :
+#   int margin : The margin in px added around the calibrated zone.
+#   int top_margin : The margin in px added above the zone, for the body of the people whose feet are inside.
+#   int screen_width : The width of the screen.
+#   int screen_height : The height of the screen.
+#Attributes :
+#   self.rectangle : The crop (x1, y1, x2, y2) of the last calibration on the screen, None for the full frame.
+#   self.calibration : The last calibration used to compute the rectangle.
+#Methods :
+#   crop(frame, calibration_x, calibration_y) :
+#       Return the crop of the frame and its offset (x, y) on the screen.
+#   remap(yolo_detections, offset) :
+#       Return the detections of a crop (at the scale of the screen) in the coordinates of the screen.
+#   configure(margin, top_margin) :
+#       Change the margins while running.
+####################################################################################################
+class Roi :
+    def __init__(self, margin, top_margin, screen_width, screen_height) :
+        self.margin = margin
+        self.top_margin = top_margin
+        self.screen_width = screen_width
+        self.screen_height = screen_height
+        self.rectangle = None
+        self.calibration = None
+
+    def configure(self, margin, top_margin) :
+        self.margin = margin
+        self.top_margin = top_margin
+        #The rectangle is computed again on the next crop
+        self.calibration = None
+
+    #Compute the crop again only when the calibration changes
+    def _update(self, calibration_x, calibration_y) :
+        calibration = (tuple(calibration_x[0]), tuple(calibration_x[1]), tuple(calibration_y[0]), tuple(calibration_y[1]))
+        if calibration == self.calibration :
+            return
+        self.calibration = calibration
+        left = calibration_x[0][0]
+        right = calibration_x[1][0]
+        top = calibration_y[0][1]
+        bottom = calibration_y[1][1]
+        #No calibration yet, the whole frame is used
+        if right <= left or bottom <= top :
+            self.rectangle = None
+            return
+        self.rectangle = (
+            int(max(left - self.margin, 0)),
+            int(max(top - self.margin - self.top_margin, 0)),
+            int(min(right + self.margin, self.screen_width)),
+            int(min(bottom + self.margin, self.screen_height)),
+        )
+
+    def crop(self, frame, calibration_x, calibration_y) :
+        self._update(calibration_x, calibration_y)
+        if self.rectangle is None :
+            return frame, None
+        #The rectangle in the pixels of the frame
+        scale_x = frame.shape[1] / self.screen_width
+        scale_y = frame.shape[0] / self.screen_height
+        x1, y1, x2, y2 = self.rectangle
+        x1, y1 = int(x1 * scale_x), int(y1 * scale_y)
+        x2, y2 = int(round(x2 * scale_x)), int(round(y2 * scale_y))
+        #A view, the frame is not copied
+        return frame[y1:y2, x1:x2], (x1 / scale_x, y1 / scale_y)
+
+    def remap(self, yolo_detections, offset) :
+        if offset is None :
+            return yolo_detections
+        x, y = offset
+        return Model_Detections(to_numpy(yolo_detections.xyxy[0]) + [x, y, x, y, 0, 0])
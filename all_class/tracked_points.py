@@ -1,17 +1,32 @@
 from norfair import Detection, Tracker
-import torch
 from typing import List
 import numpy as np
 
+from all_class.model import to_numpy
+
 
 class Tracked_Points :
-    def __init__(self, mode, distance_threshold_bbox) :
+    def __init__(self, mode, distance_threshold_bbox, detect_every = 1, latency_budget = 0, max_detect_every = 4) :
+        #Detect every detect_every frames, the tracker estimates the positions in between.
+        self.detect_every = max(detect_every, 1)
+        #The configured detect_every, the start of the adaptation
+        self.base_detect_every = self.detect_every
+        #If above 0, detect_every is adapted to keep the detector's latency per frame under latency_budget seconds.
+        self.latency_budget = latency_budget
+        self.max_detect_every = max(max_detect_every, self.detect_every)
+        #Mean latency of the detector
+        self.latency = None
+        self._skipped = 0
+        self._new_tracker(mode, distance_threshold_bbox)
+
+    def _new_tracker(self, mode, distance_threshold_bbox):
         #Constants
         DISTANCE_THRESHOLD_BBOX: float = distance_threshold_bbox
         #On the test session, tried with 0.8
         DISTANCE_THRESHOLD_CENTROID: int = 30
 
         self.track_points = mode
+        self.distance_threshold_bbox = distance_threshold_bbox
         distance_function = "iou" if self.track_points == "bbox" else "euclidean"
         distance_threshold = (
             DISTANCE_THRESHOLD_BBOX
@@ -24,40 +39,65 @@ class Tracked_Points :
             hit_counter_max=30
         )
 
-    def yolo_detections_to_tracked_points(self, yolo_detections: torch.tensor) -> List[Detection]:
-        """convert detections_as_xywh to norfair detections"""
-        norfair_detections: List[Detection] = []
+    def configure(self, mode, distance_threshold_bbox, detect_every = 1, latency_budget = 0, max_detect_every = 4):
+        """change the parameters while running, a new mode or distance restart the tracker (new ids)"""
+        detect_every = max(detect_every, 1)
+        #The value adapted to the latency is kept, unless the configured one changed or the adaptation stopped
+        if detect_every != self.base_detect_every or latency_budget <= 0:
+            self.detect_every = detect_every
+        self.base_detect_every = detect_every
+        self.latency_budget = latency_budget
+        self.max_detect_every = max(max_detect_every, detect_every)
+        self.detect_every = min(self.detect_every, self.max_detect_every)
+        if mode != self.track_points or distance_threshold_bbox != self.distance_threshold_bbox:
+            self._new_tracker(mode, distance_threshold_bbox)
+
+    def yolo_detections_to_norfair(self, yolo_detections) -> List[Detection]:
+        """convert the detections of the first image to norfair detections"""
+        #One transfer of the whole tensor, rows are [x1, y1, x2, y2, confidence, class]
+        detections_as_xyxy = to_numpy(yolo_detections.xyxy[0])
+        confidences = detections_as_xyxy[:, 4]
+        labels = detections_as_xyxy[:, 5].astype(int).tolist()
 
         if self.track_points == "centroid":
-            detections_as_xywh = yolo_detections.xywh[0]
-            for detection_as_xywh in detections_as_xywh:
-                centroid = np.array(
-                    [detection_as_xywh[0].item(), detection_as_xywh[1].item()]
-                )
-                scores = np.array([detection_as_xywh[4].item()])
-                norfair_detections.append(
-                    Detection(
-                        points=centroid,
-                        scores=scores,
-                        label=int(detection_as_xywh[-1].item()),
-                    )
-                )
+            points = (detections_as_xyxy[:, 0:2] + detections_as_xyxy[:, 2:4]) / 2
+            scores = confidences[:, None]
         elif self.track_points == "bbox":
-            detections_as_xyxy = yolo_detections.xyxy[0]
-            for detection_as_xyxy in detections_as_xyxy:
-                bbox = np.array(
-                    [
-                        [detection_as_xyxy[0].item(), detection_as_xyxy[1].item()],
-                        [detection_as_xyxy[2].item(), detection_as_xyxy[3].item()],
-                    ]
-                )
-                scores = np.array(
-                    [detection_as_xyxy[4].item(), detection_as_xyxy[4].item()]
-                )
-                norfair_detections.append(
-                    Detection(
-                        points=bbox, scores=scores, label=int(detection_as_xyxy[-1].item())
-                    )
-                )
-
-        return self.tracker.update(norfair_detections), norfair_detections
\ No newline at end of file
+            points = detections_as_xyxy[:, 0:4].reshape(-1, 2, 2)
+            scores = np.repeat(confidences[:, None], 2, axis=1)
+
+        return [
+            Detection(points=point, scores=score, label=label)
+            for point, score, label in zip(points, scores, labels)
+        ]
+
+    def yolo_detections_to_tracked_points(self, yolo_detections) -> List[Detection]:
+        """convert detections_as_xyxy to norfair detections and update the tracker"""
+        norfair_detections = self.yolo_detections_to_norfair(yolo_detections)
+        #The period tell norfair that the detections come every detect_every frames
+        return self.tracker.update(norfair_detections, period=self.detect_every), norfair_detections
+
+    def predict(self):
+        """update the tracker without detections, on the frames where the detector doesn't run"""
+        return self.tracker.update(), []
+
+    def need_detection(self) -> bool:
+        """return True if the detector must run on this frame"""
+        if self._skipped + 1 >= self.detect_every:
+            self._skipped = 0
+            return True
+        self._skipped += 1
+        return False
+
+    def report_latency(self, latency: float):
+        """adapt detect_every to the latency in seconds of the last detection"""
+        self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+        if self.latency_budget <= 0:
+            return
+        #Latency of the detector spread over the frames
+        if self.latency / self.detect_every > self.latency_budget and self.detect_every < self.max_detect_every:
+            self.detect_every += 1
+        #Margin of 20% to not switch back and forth
+        elif self.detect_every > 1 and self.latency / (self.detect_every - 1) < 0.8 * self.latency_budget:
+            self.detect_every -= 1
+
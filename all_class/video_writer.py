@@ -0,0 +1,89 @@
+import os
+import queue
+import threading
+import time
+import cv2
+
+
+#Policies when the queue is full
+BLOCK = "block"
+DROP = "drop"
+#Value put in the queue to stop the thread
+_END = object()
+
+
+####################################################################################################
+#Video_Writer : Thread encoding the frames of the local output, so the main loop only pay a queue put.
+#Parameters :
+#   String output_name : The name of the output, need to finish with a .mp4.
+#   int fourcc : The codec of the output.
+#   float fps : The frame rate of the output.
+#   tuple size : The size (width, height) of the frames.
+#   int queue_size : The maximum number of frames waiting to be encoded.
+#   String policy : What to do when the queue is full, "block" (wait) or "drop" (drop the new frame).
+#   float segment_seconds : The duration in seconds of each file (measured on the clock, the frame rate of a stream
+#                           is often unknown), 0 to write only one file.
+#Attributes :
+#   self.frames : The queue of the frames waiting to be encoded.
+#   self.written : The number of frames encoded.
+#   self.dropped : The number of frames dropped because the queue was full.
+#   self.segment : The number of the current file.
+#Methods :
+#   write(frame) :
+#       Add a frame to the queue.
+#   close() :
+#       Encode the frames still in the queue and close the file.
+####################################################################################################
+class Video_Writer(threading.Thread) :
+    def __init__(self, output_name, fourcc, fps, size, queue_size = 64, policy = BLOCK, segment_seconds = 0) :
+        if policy not in (BLOCK, DROP) :
+            raise ValueError(f'Unknown writer policy : {policy}')
+        super().__init__(name="video_writer", daemon=True)
+        self.output_name = output_name
+        self.fourcc = fourcc
+        self.fps = fps
+        self.size = size
+        self.policy = policy
+        self.segment_seconds = segment_seconds
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.written = 0
+        self.dropped = 0
+        self.segment = 0
+        self._segment_start = time.monotonic()
+        self._writer = self._open()
+        self.start()
+
+    #Open the file of the current segment, output_001.mp4, output_002.mp4, ... when segmented
+    def _open(self) :
+        name = self.output_name
+        if self.segment_seconds > 0 :
+            root, extension = os.path.splitext(self.output_name)
+            name = f'{root}_{self.segment:03d}{extension}'
+        return cv2.VideoWriter(name, self.fourcc, self.fps, self.size)
+
+    def write(self, frame) :
+        if self.policy == BLOCK :
+            self.frames.put(frame)
+            return
+        try :
+            self.frames.put_nowait(frame)
+        except queue.Full :
+            self.dropped += 1
+
+    def run(self) :
+        while True :
+            frame = self.frames.get()
+            if frame is _END :
+                break
+            if self.segment_seconds > 0 and time.monotonic() - self._segment_start >= self.segment_seconds :
+                self._writer.release()
+                self.segment += 1
+                self._segment_start = time.monotonic()
+                self._writer = self._open()
+            self._writer.write(frame)
+            self.written += 1
+        self._writer.release()
+
+    def close(self) :
+        self.frames.put(_END)
+        self.join()
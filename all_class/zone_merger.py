@@ -0,0 +1,86 @@
+####################################################################################################
+#Zone_Merger : Class merging the informations of several cameras into one coordinate space for the whole
+#              installation, and giving the same id to a person seen by two cameras where their views overlap.
+#Parameters :
+#   list zones : The part of the installation seen by each camera, [start, end] in % of the installation
+#                for the calibrated zone of the camera. Empty to split the installation evenly.
+#   int nbr_cameras : The number of cameras.
+#   float handoff_distance : The distance in % of the installation under which the detections of two cameras
+#                            are the same person.
+#Attributes :
+#   self.global_of : The global id of each tracked id of each camera, {(camera, id) : global id}.
+#   self.next_id : The next global id.
+#Methods :
+#   merge(informations) :
+#       Return the informations of all the cameras with global ids and positions, one person only once.
+#       informations : The informations of each camera (Detection_Process.get_final_objects()),
+#                      [id, inside/outside, moving, position in % of the camera].
+####################################################################################################
+class Zone_Merger :
+    def __init__(self, zones, nbr_cameras, handoff_distance = 3) :
+        self.configure(zones, nbr_cameras, handoff_distance)
+        self.global_of = {}
+        self.next_id = 1
+
+    def configure(self, zones, nbr_cameras, handoff_distance = 3) :
+        if not zones :
+            zones = [[100 * camera / nbr_cameras, 100 * (camera + 1) / nbr_cameras] for camera in range(nbr_cameras)]
+        if len(zones) != nbr_cameras :
+            raise ValueError(f'{len(zones)} zones for {nbr_cameras} cameras')
+        self.zones = zones
+        self.handoff_distance = handoff_distance
+
+    def merge(self, informations) :
+        merged = []
+        known, new = [], []
+        for camera, camera_informations in enumerate(informations) :
+            start, end = self.zones[camera]
+            for id, in_, move, pos in camera_informations :
+                information = [id, in_, move, start + pos * (end - start) / 100]
+                #Ids not tracked by Norfair are not merged
+                if id == -1 :
+                    merged.append(information)
+                elif (camera, id) in self.global_of :
+                    known.append((camera, information))
+                else :
+                    new.append((camera, information))
+        #Entry of each global id in merged, with its camera
+        entries = {}
+        seen = set()
+        #The persons already tracked first, so a new track of any camera can take the id of one of them
+        for camera, information in known + new :
+            key = (camera, information[0])
+            seen.add(key)
+            global_id = self.global_of.get(key)
+            if global_id is None :
+                global_id = self.global_of[key] = self._handoff(camera, information[3], entries)
+            entry = entries.get(global_id)
+            if entry is not None and abs(entry[1][3] - information[3]) > self.handoff_distance :
+                #Two different persons with the same id, the new one get its own
+                global_id = self.global_of[key] = self._new_id()
+                entry = None
+            if entry is None :
+                information[0] = global_id
+                merged.append(information)
+                entries[global_id] = (camera, information)
+            else :
+                #Seen by two cameras, the mean position and moving if one of them see a move
+                entry[1][3] = (entry[1][3] + information[3]) / 2
+                entry[1][2] = entry[1][2] or information[2]
+        #Forget the ids not tracked anymore
+        for key in [key for key in self.global_of if key not in seen] :
+            del self.global_of[key]
+        return merged
+
+    #Global id of the closest person seen by another camera, in the overlap of their views, or a new id
+    def _handoff(self, camera, position, entries) :
+        best, best_distance = None, self.handoff_distance
+        for global_id, (other_camera, information) in entries.items() :
+            distance = abs(information[3] - position)
+            if other_camera != camera and distance <= best_distance :
+                best, best_distance = global_id, distance
+        return best if best is not None else self._new_id()
+
+    def _new_id(self) :
+        self.next_id += 1
+        return self.next_id - 1
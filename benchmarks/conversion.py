@@ -0,0 +1,80 @@
+import argparse
+import time
+import numpy as np
+import torch
+from norfair import Detection
+
+from all_class.tracked_points import Tracked_Points
+
+
+####################################################################################################
+#Benchmark of the conversion from the YOLO detections to the Norfair detections.
+#Compare Tracked_Points.yolo_detections_to_norfair() with the former conversion calling .item()
+#for each value of each box.
+#Execution from the root of the project : py -m benchmarks.conversion
+####################################################################################################
+
+
+#Same attribute as the results of the model used by Tracked_Points
+class FakeDetections :
+    def __init__(self, xyxy) :
+        self.xyxy = [xyxy]
+
+
+#Random boxes in a 1280x720 frame, rows are [x1, y1, x2, y2, confidence, class]
+def random_detections(nbr_detections, generator) :
+    tl = generator.uniform((0, 0), (1180, 520), size=(nbr_detections, 2))
+    size = generator.uniform((20, 60), (100, 200), size=(nbr_detections, 2))
+    confidence = generator.uniform(0.1, 1, size=(nbr_detections, 1))
+    label = np.zeros((nbr_detections, 1))
+    return torch.tensor(np.hstack((tl, tl + size, confidence, label)), dtype=torch.float32)
+
+
+#Former conversion, one .item() per value
+def per_element_conversion(yolo_detections) :
+    norfair_detections = []
+    for detection_as_xyxy in yolo_detections.xyxy[0]:
+        bbox = np.array(
+            [
+                [detection_as_xyxy[0].item(), detection_as_xyxy[1].item()],
+                [detection_as_xyxy[2].item(), detection_as_xyxy[3].item()],
+            ]
+        )
+        scores = np.array(
+            [detection_as_xyxy[4].item(), detection_as_xyxy[4].item()]
+        )
+        norfair_detections.append(
+            Detection(
+                points=bbox, scores=scores, label=int(detection_as_xyxy[-1].item())
+            )
+        )
+    return norfair_detections
+
+
+#Return the mean time in ms of one call of conversion
+def measure(conversion, yolo_detections, repeat) :
+    conversion(yolo_detections)
+    start = time.perf_counter()
+    for _ in range(repeat) :
+        conversion(yolo_detections)
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main(raw_arg = None) :
+    parser = argparse.ArgumentParser(description="Benchmark of the YOLO to Norfair conversion")
+    parser.add_argument("-n", type=int, nargs="+", default=[10, 100, 300], dest="sizes", help="Number of detections per frame")
+    parser.add_argument("-r", type=int, default=200, dest="repeat", help="Number of frames for each measure")
+    args = parser.parse_args(raw_arg)
+
+    tracked_points = Tracked_Points("bbox", 0.7)
+    generator = np.random.default_rng(0)
+    print(f'{"detections":>10} | {"per element (ms)":>16} | {"vectorized (ms)":>15} | {"speedup":>7}')
+    for nbr_detections in args.sizes :
+        yolo_detections = FakeDetections(random_detections(nbr_detections, generator))
+        before = measure(per_element_conversion, yolo_detections, args.repeat)
+        after = measure(tracked_points.yolo_detections_to_norfair, yolo_detections, args.repeat)
+        print(f'{nbr_detections:>10} | {before:>16.3f} | {after:>15.3f} | {before / after:>6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,311 @@
+import argparse
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+import cv2
+import numpy as np
+
+from all_class.io import IO
+from all_class.model import Model, Model_Detections
+from all_class.inference_pool import Inference_Pool, SLOTS_PER_WORKER, worker_threads
+from all_class.osc_client import OSC_Client
+from all_class.tracked_points import Tracked_Points
+from all_class.detection_process import Detection_Process
+from all_class.moving import Moving
+from all_class.draw import Draw
+from all_class.detection_store import Detection_Recorder, Detection_Replay
+from all_class.detection_gate import Detection_Gate
+from all_class.config import DEFAULTS
+
+
+####################################################################################################
+#End-to-end benchmark : Replay a local MP4 (or a generated clip) through IO, Model (real or stub),
+#                       Tracked_Points, Detection_Process, Moving, OSC_Client (to a local UDP sink) and Draw.
+#Report the FPS, the p50/p95/p99 latency of each stage and the peak memory in JSON, and compare them to a
+#baseline to flag the regressions (exit code 1).
+#Execution from the root of the project :
+#   py -m benchmarks.replay --synthetic 300 -o bench.json
+#   py -m benchmarks.replay -i video.mp4 --model real --baseline bench.json
+#   py -m benchmarks.replay -i video.mp4 --model real --record detections/
+#   py -m benchmarks.replay --detections detections/ --set MIN_AGE=3 --set DISTANCE_THRESHOLD_BBOX=0.5
+#With --detections and without -i, the video is not decoded (no capture and no draw), for the parameter sweeps.
+####################################################################################################
+
+
+#Same values as main.py
+SCREEN_WIDTH = DEFAULTS["SCREEN_WIDTH"]
+SCREEN_HEIGHT = DEFAULTS["SCREEN_HEIGHT"]
+CALIBRATION_X = DEFAULTS["MANUAL_CALIBRATION_X"]
+CALIBRATION_Y = DEFAULTS["MANUAL_CALIBRATION_Y"]
+SETTINGS = {name : DEFAULTS[name] for name in ("MODE", "DISTANCE_THRESHOLD_BBOX", "MIN_AGE", "MIN_SCORE_NORFAIR", "OUT_ID",
+                                               "NBR_PEOPLE_MAX", "NBR_INFO", "COUNTDOWN", "LEAVING_OFFSET", "TIME_TO_LET_GO",
+                                               "APPEAR_OFFSET", "DIFF_DIST", "NBR_FRAME", "GATE", "GATE_MARGIN", "GATE_MODE",
+                                               "GATE_WEIGHT", "GATE_IOU", "GATE_LOW_CONFIDENCE")}
+STAGES = ["capture", "inference", "tracking", "detection_process", "osc", "draw"]
+
+
+#Position of the synthetic people on a frame, one box [x1, y1, x2, y2] per person
+def synthetic_boxes(index, nbr_people) :
+    boxes = []
+    for person in range(nbr_people) :
+        #Each person walk back and forth at its own speed
+        period = 200 + 37 * person
+        x = 40 + (SCREEN_WIDTH - 160) * abs((index + 50 * person) % (2 * period) - period) / period
+        y = 380 + 40 * (person % 5)
+        boxes.append([x, y, x + 70, y + 220])
+    return boxes
+
+
+#Write a clip of moving people on a dark scene with two bright lights as calibration zone
+def generate_clip(path, nbr_frames, nbr_people) :
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), 25, (SCREEN_WIDTH, SCREEN_HEIGHT))
+    for index in range(nbr_frames) :
+        frame = np.full((SCREEN_HEIGHT, SCREEN_WIDTH, 3), 30, dtype=np.uint8)
+        cv2.rectangle(frame, (20, 440), (60, 650), (255, 255, 255), cv2.FILLED)
+        cv2.rectangle(frame, (1220, 440), (1260, 650), (255, 255, 255), cv2.FILLED)
+        for x1, y1, x2, y2 in synthetic_boxes(index, nbr_people) :
+            cv2.rectangle(frame, (int(x1), int(y1)), (int(x2), int(y2)), (90, 120, 160), cv2.FILLED)
+        writer.write(frame)
+    writer.release()
+
+
+####################################################################################################
+#Stub_Model : Replace the YOLO model, return the boxes of the synthetic people with a little noise.
+####################################################################################################
+class Stub_Model :
+    def __init__(self, nbr_people) :
+        self.nbr_people = nbr_people
+        self.index = 0
+        self.generator = np.random.default_rng(0)
+
+    def getDetections(self, frame, scale = None) :
+        boxes = np.array(synthetic_boxes(self.index, self.nbr_people), dtype=np.float64).reshape(-1, 4)
+        boxes += self.generator.normal(0, 1.5, size=boxes.shape)
+        scores = self.generator.uniform(0.5, 0.95, size=(len(boxes), 1))
+        self.index += 1
+        return Model_Detections(np.hstack((boxes, scores, np.zeros((len(boxes), 1)))))
+
+
+#Local UDP server receiving (and dropping) the OSC messages, return its port
+def start_udp_sink() :
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(("127.0.0.1", 0))
+
+    def drain() :
+        while True :
+            sink.recv(65535)
+
+    threading.Thread(target=drain, daemon=True).start()
+    return sink.getsockname()[1]
+
+
+#Peak resident memory of the process in MB, None if unknown on this system
+def peak_memory() :
+    try :
+        import resource
+    except ImportError :
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #Bytes on macOS, KB on Linux
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+#Replace the video when only the recorded detections are replayed, the frames are None
+class _No_Video :
+    def __init__(self, replay) :
+        self.frame_sequence = 0
+        self.last_sequence = int(replay.sequences[-1]) if len(replay) else 0
+
+    def get_Frame(self) :
+        if self.frame_sequence >= self.last_sequence :
+            return False, None
+        self.frame_sequence += 1
+        return True, None
+
+    def close(self) :
+        pass
+
+
+def run(args) :
+    replay = Detection_Replay(args.detections) if args.detections else None
+    if args.input is None :
+        io = _No_Video(replay)
+    else :
+        io = IO(["-i", args.input], SCREEN_WIDTH, SCREEN_HEIGHT)
+    if replay is not None :
+        model = None
+    elif args.model == "stub" :
+        model = Stub_Model(args.people)
+    elif args.workers > 0 :
+        model = Inference_Pool((True, 0.1, args.yolo_path, args.model_path, args.backend, args.size, False,
+                                worker_threads(args.threads, args.workers), (SCREEN_WIDTH, SCREEN_HEIGHT)),
+                               args.workers)
+    else :
+        model = Model(True, 0.1, args.yolo_path, args.model_path, args.backend, args.size, False, args.threads,
+                      (SCREEN_WIDTH, SCREEN_HEIGHT))
+    pooled = isinstance(model, Inference_Pool)
+    #Frames submitted to the workers and not processed yet, (frame, sequence, Future)
+    pending = deque()
+    ended = False
+    recorder = Detection_Recorder(args.record) if args.record else None
+    tracked_points = Tracked_Points(SETTINGS["MODE"], SETTINGS["DISTANCE_THRESHOLD_BBOX"])
+    detection_process = Detection_Process(SCREEN_WIDTH, SCREEN_HEIGHT)
+    moving = Moving(SETTINGS["DIFF_DIST"], SETTINGS["NBR_FRAME"])
+    osc_client = OSC_Client(SETTINGS["NBR_PEOPLE_MAX"], SETTINGS["NBR_INFO"], "127.0.0.1", start_udp_sink(), args.osc_mode)
+    draw = Draw()
+    gate = Detection_Gate(SETTINGS["GATE_MARGIN"], SETTINGS["GATE_MODE"], SETTINGS["GATE_WEIGHT"], SETTINGS["GATE_IOU"],
+                          SETTINGS["GATE_LOW_CONFIDENCE"])
+    #Same calibration as IO.set_manual_calibration(CALIBRATION_X, CALIBRATION_Y)
+    cal_x = [CALIBRATION_X[0][0], CALIBRATION_X[1][0]]
+    cal_y = [CALIBRATION_Y[0][1], CALIBRATION_Y[1][1]]
+
+    latencies = {stage : [] for stage in STAGES}
+    start = time.perf_counter()
+    frames = 0
+    while args.frames <= 0 or frames < args.frames :
+        times = [time.perf_counter()]
+        if pooled :
+            #The next frames are submitted before waiting for the detections of this one
+            while not ended and len(pending) < SLOTS_PER_WORKER * args.workers :
+                ret, frame = io.get_Frame()
+                if not ret :
+                    ended = True
+                    break
+                pending.append((frame, io.frame_sequence, model.submit(frame, io.get_scale(frame))))
+            if not pending :
+                break
+            frame, sequence, future = pending.popleft()
+        else :
+            ret, frame = io.get_Frame()
+            if not ret :
+                break
+            sequence = io.frame_sequence
+        times.append(time.perf_counter())
+        if replay is not None :
+            yolo_detections = replay.getDetections(sequence)
+        else :
+            yolo_detections = future.result() if pooled else model.getDetections(frame, io.get_scale(frame))
+            if recorder is not None :
+                recorder.append(sequence, yolo_detections)
+        times.append(time.perf_counter())
+        if yolo_detections is None :
+            tracked_objects, raw = tracked_points.predict()
+        else :
+            if SETTINGS["GATE"] :
+                yolo_detections = gate.filter(yolo_detections, cal_x, cal_y, len(tracked_points.tracker.tracked_objects))
+            tracked_objects, raw = tracked_points.yolo_detections_to_tracked_points(yolo_detections)
+        times.append(time.perf_counter())
+        detection_list = detection_process.get_final_objects(tracked_objects, SETTINGS["MIN_AGE"], SETTINGS["MIN_SCORE_NORFAIR"],
+                                                             moving, cal_x, cal_y, SETTINGS["OUT_ID"])
+        times.append(time.perf_counter())
+        osc_client.send_info(detection_list, SETTINGS["COUNTDOWN"], SETTINGS["LEAVING_OFFSET"], SETTINGS["TIME_TO_LET_GO"],
+                             SETTINGS["APPEAR_OFFSET"])
+        times.append(time.perf_counter())
+        if frame is not None :
+            draw.draw_info(io.screen_frame(frame), detection_process.draw_info, osc_client.info_list, CALIBRATION_X,
+                           CALIBRATION_Y, SETTINGS["OUT_ID"], raw, tracked_objects, True)
+        times.append(time.perf_counter())
+        for stage, begin, end in zip(STAGES, times, times[1:]) :
+            latencies[stage].append((end - begin) * 1000)
+        frames += 1
+    elapsed = time.perf_counter() - start
+    io.close()
+    if pooled :
+        model.close()
+    if recorder is not None :
+        recorder.close()
+
+    report = {
+        "input" : args.input,
+        "model" : "replay" if replay is not None else args.model if args.model == "stub" else args.backend,
+        "settings" : SETTINGS,
+        "frames" : frames,
+        "fps" : frames / elapsed if elapsed > 0 else 0,
+        "stages" : {},
+        "peak_memory_mb" : peak_memory(),
+    }
+    if SETTINGS["GATE"] :
+        report["gate"] = {"seen" : gate.seen, "dropped_zone" : gate.dropped_zone, "weighted" : gate.weighted,
+                          "dropped_overlap" : gate.dropped_overlap, "avoided_pairs" : gate.avoided_pairs}
+    for stage, values in latencies.items() :
+        if values :
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            report["stages"][stage] = {"mean" : float(np.mean(values)), "p50" : float(p50), "p95" : float(p95), "p99" : float(p99)}
+    return report
+
+
+#Return the list of the regressions of report compared to baseline, tolerance is a fraction (0.1 = 10%)
+def compare(report, baseline, tolerance) :
+    regressions = []
+    if report["fps"] < baseline["fps"] * (1 - tolerance) :
+        regressions.append(f'fps : {report["fps"]:.1f} < {baseline["fps"]:.1f}')
+    for stage, latency in baseline["stages"].items() :
+        if stage not in report["stages"] :
+            continue
+        for percentile in ("p50", "p95") :
+            #Under 0.1 ms, the differences are noise
+            limit = max(latency[percentile] * (1 + tolerance), latency[percentile] + 0.1)
+            if report["stages"][stage][percentile] > limit :
+                regressions.append(f'{stage} {percentile} : {report["stages"][stage][percentile]:.2f} ms > {latency[percentile]:.2f} ms')
+    return regressions
+
+
+def main(raw_arg = None) :
+    parser = argparse.ArgumentParser(description="End-to-end replay benchmark")
+    parser.add_argument("-i", type=str, default=None, dest="input", help="Input MP4, a clip is generated if not given")
+    parser.add_argument("--synthetic", type=int, default=300, help="Number of frames of the generated clip")
+    parser.add_argument("--people", type=int, default=8, help="Number of people in the generated clip and the stub model")
+    parser.add_argument("--frames", type=int, default=0, help="Maximum number of frames, 0 for the whole video")
+    parser.add_argument("--model", choices=["stub", "real"], default="stub", help="Stub model or real YOLO model")
+    parser.add_argument("--backend", type=str, default="hub", help="Backend of the real model")
+    parser.add_argument("--yolo-path", type=str, default=r'../local_lib/yolov5', help="Path to Yolo local librairie")
+    parser.add_argument("--model-path", type=str, default=r'/model/yolov5l6.pt', help="Path to the model")
+    parser.add_argument("--size", type=int, default=640, help="Input size of the real model")
+    parser.add_argument("--threads", type=int, default=0, help="Number of CPU threads of the real model")
+    parser.add_argument("--workers", type=int, default=0, help="Number of processes running the real model, 0 for none")
+    parser.add_argument("--osc-mode", type=str, default="message", help="Output mode of the OSC client")
+    parser.add_argument("--record", type=str, default=None, help="Record the detections of the model in this directory")
+    parser.add_argument("--detections", type=str, default=None, help="Replay the detections recorded in this directory")
+    parser.add_argument("--set", type=str, default=[], action="append", metavar="NAME=VALUE",
+                        help="Change a value of SETTINGS, can be repeated")
+    parser.add_argument("-o", type=str, default=None, dest="output", help="Write the JSON report in this file")
+    parser.add_argument("--baseline", type=str, default=None, help="JSON report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Accepted slowdown compared to the baseline")
+    args = parser.parse_args(raw_arg)
+    for setting in args.set :
+        name, value = setting.split("=", 1)
+        if name not in SETTINGS :
+            parser.error(f'Unknown setting : {name}')
+        #A JSON value, or a string (MODE, GATE_MODE)
+        try :
+            SETTINGS[name] = json.loads(value)
+        except ValueError :
+            SETTINGS[name] = value
+
+    with tempfile.TemporaryDirectory() as directory :
+        if args.input is None and args.detections is None :
+            args.input = os.path.join(directory, "synthetic.mp4")
+            generate_clip(args.input, args.synthetic, args.people)
+        report = run(args)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output :
+        with open(args.output, "w") as file :
+            file.write(text)
+    if args.baseline :
+        with open(args.baseline) as file :
+            regressions = compare(report, json.load(file), args.tolerance)
+        for regression in regressions :
+            print(f'REGRESSION : {regression}', file=sys.stderr)
+        if regressions :
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()